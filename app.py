@@ -1,17 +1,573 @@
 import os
-from flask import Flask, request, abort, jsonify
+import itertools
+from flask import Flask, request, abort, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from datetime import datetime, date
+from sqlalchemy import tuple_
 
-from models import setup_db, Movie, Actor
-from auth import AuthError, requires_auth
+from models import (setup_db, db, Movie, Actor, update_rows, delete_rows, related_rows, assign_actor,
+                    unassign_actor, rollup_counts, STATS_AGE_BUCKET, warm_pool, pool_ready,
+                    pool_stats)
+import auth
+from auth import AuthError, requires_auth, add_server_timing, setup_auth
+from search import search
+from cache import cached, cache_stats, validators
+from serialization import jsonify, dumps
+from warmup import WarmUp, WARM_UP
 
+# Number of rows returned by the list endpoints when no limit is given
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+# Maximum number of rows a single list request can return
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+# Number of rows fetched per round trip when streaming a full listing
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+# Maximum number of records a single bulk request can create
+MAX_BULK_SIZE = int(os.environ.get('MAX_BULK_SIZE', 1000))
+
+
+'''
+parse_movie(body, partial=False)
+    validates the json body of a new movie, or of a movie update if partial
+    it should raise a ValueError describing the problem if
+        title or release_date are missing (both of them if partial)
+        release_date isn't formatted like "March 04, 2022"
+returns the column values of the movie, only the ones in body if partial
+'''
+def parse_movie(body, partial=False):
+  if not isinstance(body, dict):
+    raise ValueError('movie must be a json object')
+
+  title = body.get('title', None)
+  release_date = body.get('release_date', None)
+  if partial:
+    if title is None and release_date is None:
+      raise ValueError('title or release_date is required')
+  elif title is None or release_date is None:
+    raise ValueError('title and release_date are required')
+
+  values = {}
+  if title is not None:
+    values['title'] = title
+  if release_date is not None:
+    try:
+      values['release_date'] = datetime.strptime(release_date, "%B %d, %Y").date()
+    except (TypeError, ValueError):
+      raise ValueError('release_date must be formatted like "March 04, 2022"')
+
+  return values
+
+
+'''
+UnprocessableValue
+A ValueError raised for a field whose value has the wrong type, which the
+endpoints reject with a 422 error instead of a 400
+'''
+class UnprocessableValue(ValueError):
+  pass
+
+
+'''
+parse_actor(body, partial=False)
+    validates the json body of a new actor, or of an actor update if partial
+    it should raise a ValueError describing the problem if
+        name, age or gender are missing (all of them if partial)
+    it should raise an UnprocessableValue if
+        age isn't an integer, floats, numeric strings and booleans included
+        gender isn't 'male' or 'female'
+returns the column values of the actor, only the ones in body if partial
+'''
+def parse_actor(body, partial=False):
+  if not isinstance(body, dict):
+    raise ValueError('actor must be a json object')
+
+  name = body.get('name', None)
+  age = body.get('age', None)
+  gender = body.get('gender', None)
+  if partial:
+    if name is None and age is None and gender is None:
+      raise ValueError('name, age or gender is required')
+  elif name is None or age is None or gender is None:
+    raise ValueError('name, age and gender are required')
+
+  values = {}
+  if name is not None:
+    values['name'] = name
+  if age is not None:
+    # bool is an int subclass, but true isn't an age
+    if not isinstance(age, int) or isinstance(age, bool):
+      raise UnprocessableValue('age must be an integer')
+    values['age'] = age
+  if gender is not None:
+    if gender == 'male':
+      values['gender'] = True
+    elif gender == 'female':
+      values['gender'] = False
+    else:
+      raise ValueError("gender must be 'male' or 'female'")
+
+  return values
+
+
+'''
+parse_patch(model, parse, id)
+    validates the json body of an update of the row of model with id, see
+    parse
+    it should respond with a 404 error if the body isn't valid and there is
+        no row of model with id, so a missing row is reported first, while a
+        valid body costs no lookup
+    it should respond with a 400 error if the body isn't valid for parse, or
+        a 422 error if one of its values has the wrong type
+returns the column values to update
+'''
+def parse_patch(model, parse, id):
+  try:
+    return parse(request.get_json(silent=True), partial=True)
+  except ValueError as error:
+    if db.session.query(model.id).filter(model.id == id).scalar() is None:
+      abort(404)
+    abort(422 if isinstance(error, UnprocessableValue) else 400)
+
+
+'''
+bulk_create(model, key, parse)
+    creates the records listed in the request's json body {"<key>": [...]}
+    every record is validated with parse before anything is written
+    it should respond with a 400 error if the body isn't a list of at most
+        MAX_BULK_SIZE records
+    with {"atomic": true} in the body nothing is created if any record is
+        invalid, otherwise the valid records are created and the invalid
+        ones reported
+    the valid records are inserted in a single transaction, which the
+        ORM batches into multi-row INSERT ... RETURNING statements on
+        PostgreSQL
+returns status code 200 and json {"success": True, "created": created, "errors": errors}
+    where created lists the {"index", "id"} of the new records and errors the
+    {"index", "message"} of the rejected ones, or status code 400 with the
+    errors if an atomic request has invalid records
+'''
+def bulk_create(model, key, parse):
+  body = request.get_json()
+  if not isinstance(body, dict):
+    abort(400)
+  records = body.get(key, None)
+  if not isinstance(records, list) or not records or len(records) > MAX_BULK_SIZE:
+    abort(400)
+  atomic = body.get('atomic', False) is True
+
+  # Validate every record up front
+  rows = []
+  errors = []
+  for index, record in enumerate(records):
+    try:
+      rows.append((index, model(**parse(record))))
+    except ValueError as e:
+      errors.append({'index': index, 'message': str(e)})
+
+  if errors and (atomic or not rows):
+    return jsonify({
+      'success': False,
+      'error': 400,
+      'message': 'bad request',
+      'errors': errors
+    }), 400
+
+  try:
+    db.session.add_all([row for index, row in rows])
+    db.session.flush()
+    # Read before the commit expires the rows, which would reload every
+    # one of them with its own SELECT
+    created = [{'index': index, 'id': row.id} for index, row in rows]
+    db.session.commit()
+  except:
+    db.session.rollback()
+    abort(422)
+
+  return jsonify({
+    'success': True,
+    'created': created,
+    'errors': errors
+  })
+
+
+'''
+parse_ids()
+    reads the {"ids": [...]} list of a bulk update or delete request body
+    it should respond with a 400 error if ids isn't a non empty list of at
+        most MAX_BULK_SIZE integers
+returns the body and the ids, without duplicates, in request order
+'''
+def parse_ids():
+  body = request.get_json()
+  if not isinstance(body, dict):
+    abort(400)
+  ids = body.get('ids', None)
+  if not isinstance(ids, list) or not ids or len(ids) > MAX_BULK_SIZE:
+    abort(400)
+  if not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+    abort(400)
+  return body, list(dict.fromkeys(ids))
+
+
+'''
+bulk_update(model, parse)
+    applies the {"patch": {...}} document of the request's json body to the
+    rows whose id is in {"ids": [...]}, with a single UPDATE statement
+    it should respond with a 400 error if the patch isn't valid for parse,
+        or a 422 error if one of its values has the wrong type
+returns status code 200 and json {"success": True, "updated": ids, "not_found": ids}
+'''
+def bulk_update(model, parse):
+  body, ids = parse_ids()
+  try:
+    values = parse(body.get('patch', None), partial=True)
+  except UnprocessableValue:
+    abort(422)
+  except ValueError:
+    abort(400)
+
+  try:
+    rows = update_rows(model, ids, values)
+  except:
+    abort(422)
+
+  updated = set(row.id for row in rows)
+  return jsonify({
+    'success': True,
+    'updated': [id for id in ids if id in updated],
+    'not_found': [id for id in ids if id not in updated]
+  })
+
+
+'''
+bulk_delete(model)
+    deletes the rows whose id is in the request's json body {"ids": [...]},
+    with a single DELETE statement
+returns status code 200 and json {"success": True, "deleted": ids, "not_found": ids}
+'''
+def bulk_delete(model):
+  ids = parse_ids()[1]
+  try:
+    deleted = set(delete_rows(model, ids))
+  except:
+    abort(422)
+
+  return jsonify({
+    'success': True,
+    'deleted': [id for id in ids if id in deleted],
+    'not_found': [id for id in ids if id not in deleted]
+  })
+
+
+'''
+Filters of the list endpoints
+    every query argument maps to a function building the SQL condition
+    from its value, raising a ValueError if the value isn't valid
+    each of them is backed by an index of the model
+'''
+def parse_date_arg(value):
+  return datetime.strptime(value, "%B %d, %Y").date()
+
+
+def parse_gender_arg(value):
+  if value not in ('male', 'female'):
+    raise ValueError("gender must be 'male' or 'female'")
+  return value == 'male'
+
+
+def prefix_pattern(value):
+  # Escape the LIKE wildcards so the prefix is matched literally
+  return value.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+
+
+LIST_FILTERS = {
+  Movie: {
+    'released_after': lambda value: Movie.release_date >= parse_date_arg(value),
+    'released_before': lambda value: Movie.release_date <= parse_date_arg(value),
+    'title_prefix': lambda value: Movie.title.like(prefix_pattern(value), escape='!')
+  },
+  Actor: {
+    'gender': lambda value: Actor.gender == parse_gender_arg(value),
+    'min_age': lambda value: Actor.age >= int(value),
+    'max_age': lambda value: Actor.age <= int(value)
+  }
+}
+
+# Columns the list endpoints can be sorted by with ?sort=<column> or ?sort=-<column>
+LIST_SORTS = {
+  Movie: ('id', 'title', 'release_date'),
+  Actor: ('id', 'name', 'age')
+}
+
+
+'''
+list_query(model, args)
+    builds the query of a list endpoint from its query arguments
+    it should respond with a 400 error if a filter or the sort isn't valid
+returns the query selecting model.read_columns() of the matching rows in
+    the requested order, the sort column and True if it is descending
+'''
+def list_query(model, args):
+  query = db.session.query(*model.read_columns())
+  for name, condition in LIST_FILTERS[model].items():
+    value = args.get(name, None)
+    if value is not None:
+      try:
+        query = query.filter(condition(value))
+      except ValueError:
+        abort(400)
+
+  sort = args.get('sort', 'id')
+  descending = sort.startswith('-')
+  if sort.lstrip('-') not in LIST_SORTS[model]:
+    abort(400)
+  column = getattr(model, sort.lstrip('-'))
+
+  # Ties are broken by id so the order, and the keyset, are unique
+  order = [column, model.id] if column is not model.id else [model.id]
+  query = query.order_by(*[c.desc() if descending else c for c in order])
+  return query, column, descending
+
+
+'''
+paginate(model)
+    reads the ?limit=&after=<id> keyset pagination arguments of the request
+    it should respond with a 400 error if they aren't positive integers, or
+        if the after=<id> row of a sorted listing doesn't exist anymore
+    it should cap limit to MAX_PAGE_SIZE
+    it should apply the filters and sort of the request (see list_query)
+returns the requested rows, as tuples of model.read_columns(), and the id to
+    pass as after= to get the next page, or None if this is the last page
+'''
+def paginate(model):
+  query, column, descending = list_query(model, request.args)
+  try:
+    limit = int(request.args.get('limit', PAGE_SIZE))
+    after = request.args.get('after', None)
+    after = int(after) if after is not None else None
+  except ValueError:
+    abort(400)
+  if limit < 1 or (after is not None and after < 0):
+    abort(400)
+  limit = min(limit, MAX_PAGE_SIZE)
+
+  # Seek past the cursor on the (sort column, id) index and fetch one extra
+  # row to know if there is a next page
+  if after is not None:
+    if column is model.id:
+      key, cursor = model.id, after
+    else:
+      value = db.session.query(column).filter(model.id == after).scalar()
+      if value is None:
+        abort(400)
+      key, cursor = tuple_(column, model.id), tuple_(value, after)
+    query = query.filter(key < cursor if descending else key > cursor)
+  rows = query.limit(limit + 1).all()
+
+  next_cursor = None
+  if len(rows) > limit:
+    rows = rows[:limit]
+    next_cursor = rows[-1].id
+  return rows, next_cursor
+
+
+'''
+wants_all()
+    returns True if the client explicitly asked for every row with ?all=true
+'''
+def wants_all():
+  return request.args.get('all', '').lower() == 'true'
+
+
+# Rows of the other model the list endpoints can embed with ?include=
+LIST_INCLUDES = {
+  Movie: ('actors', Actor),
+  Actor: ('movies', Movie)
+}
+
+
+'''
+wants_include(model)
+    returns True if the request asked to embed the cast of every movie with
+    ?include=actors, or the filmography of every actor with ?include=movies
+    it should respond with a 400 error for any other ?include= value
+'''
+def wants_include(model):
+  include = request.args.get('include', None)
+  if include is None:
+    return False
+  if include != LIST_INCLUDES[model][0]:
+    abort(400)
+  return True
+
+
+'''
+format_rows(model, rows, include=False)
+    formats rows of model.read_columns()
+    if include, the related rows of every row are embedded, all of them
+        loaded by a single related_rows query
+'''
+def format_rows(model, rows, include=False):
+  formatted = [model.format_row(row) for row in rows]
+  if include:
+    key, other = LIST_INCLUDES[model]
+    related = related_rows(model, [row[0] for row in rows])
+    for item in formatted:
+      item[key] = [other.format_row(row) for row in related[item['id']]]
+  return formatted
+
+
+'''
+stream_all(model, key, include=False)
+    streams every row of model matching the filters of the request, in the
+    requested order (see list_query), as
+    {"success": true, "next_cursor": null, "<key>": [...]}
+    rows are read as plain tuples of model.read_columns(), without building
+    model instances, from a server-side cursor STREAM_BATCH_SIZE at a time and
+    written out as soon as they are serialized, so the worker's memory stays
+    flat no matter how large the table is
+    rows are serialized by the json provider (see serialization.dumps)
+    if include, the related rows are loaded once per batch (see format_rows)
+'''
+def stream_all(model, key, include=False):
+  query = list_query(model, request.args)[0].yield_per(STREAM_BATCH_SIZE)
+
+  def generate():
+    yield b'{"success": true, "next_cursor": null, "%s": [' % key.encode('ascii')
+    separator = b''
+    rows = iter(query)
+    while True:
+      batch = list(itertools.islice(rows, STREAM_BATCH_SIZE))
+      if not batch:
+        break
+      yield separator + b','.join(dumps(item) for item in format_rows(model, batch, include))
+      separator = b','
+    yield b']}\n'
+
+  return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+'''
+related_list(model, id)
+    it should respond with a 404 error if there is no row of model with id
+returns the formatted cast of the movie, or filmography of the actor, of id
+'''
+def related_list(model, id):
+  if db.session.query(model.id).filter(model.id == id).scalar() is None:
+    abort(404)
+  other = LIST_INCLUDES[model][1]
+  return [other.format_row(row) for row in related_rows(model, [id])[id]]
+
+
+'''
+search_results(model, column)
+    reads the ?q=&limit= arguments of a search request
+    it should respond with a 400 error if q is missing or blank, or if
+        limit isn't a positive integer
+    it should cap limit to MAX_PAGE_SIZE
+returns the formatted rows of model whose column is similar to q, best
+    matches first, each with its similarity score (see search.search)
+'''
+def search_results(model, column):
+  q = request.args.get('q', '').strip()
+  try:
+    limit = int(request.args.get('limit', PAGE_SIZE))
+  except ValueError:
+    abort(400)
+  if not q or limit < 1:
+    abort(400)
+
+  rows = search(model, column, q, min(limit, MAX_PAGE_SIZE))
+  return [dict(model.format_row(row[:-1]), score=round(row[-1], 3)) for row in rows]
+
+
+'''
+format_stats(counts)
+    shapes the (dimension, bucket, count) tuples of rollup_counts() as the
+    json of GET /stats, buckets in ascending order
+'''
+def format_stats(counts):
+  actors = {'total': 0, 'by_gender': {'male': 0, 'female': 0}, 'by_age': []}
+  movies = {'total': 0, 'by_release_year': []}
+  for dimension, bucket, count in sorted(counts):
+    if dimension == 'actors_gender':
+      actors['total'] += count
+      actors['by_gender']['male' if bucket else 'female'] = count
+    elif dimension == 'actors_age':
+      actors['by_age'].append({
+        'min_age': bucket,
+        'max_age': bucket + STATS_AGE_BUCKET - 1,
+        'count': count
+      })
+    elif dimension == 'movies_year':
+      movies['total'] += count
+      movies['by_release_year'].append({'year': bucket, 'count': count})
+  return {'actors': actors, 'movies': movies}
+
+
+'''
+warm_up_queries(app)
+    runs the first page of GET /movies and GET /actors once, without
+    auth, so the mappers are configured and the statements compiled and
+    planned before the first real request
+'''
+def warm_up_queries(app):
+  for path, model, tables in (('/movies', Movie, ('movies', 'castings', 'actors')),
+                              ('/actors', Actor, ('actors', 'castings', 'movies'))):
+    with app.test_request_context(path):
+      validators(tables)
+      format_rows(model, paginate(model)[0])
+
+
+'''
+warm_up_steps(app)
+    the steps of the warm-up of a worker: prefetch the JWKS, open the
+    pool connections and run the hot list queries
+'''
+def warm_up_steps(app):
+  return [
+    ('jwks', lambda: auth.key_store.refresh()),
+    ('pool', warm_pool),
+    ('queries', lambda: warm_up_queries(app))
+  ]
+
+
+'''
+start_warm_up(app)
+    starts the warm-up of app in the background, once its worker runs,
+    i.e. from a gunicorn post_worker_init hook when the app was preloaded
+    before the fork
+returns the WarmUp reported by GET /readyz
+'''
+def start_warm_up(app):
+  warm_up = WarmUp(app, warm_up_steps(app))
+  app.extensions['warm_up'] = warm_up
+  warm_up.start()
+  return warm_up
+
+
+'''
+create_app(test_config=None)
+    the application factory, resolving the AUTH0_DOMAIN, API_AUDIENCE,
+    DATABASE_URL and DATABASE_REPLICA_URLS settings from test_config or
+    else from the environment
+    it should neither connect to the database nor create the schema, so
+    workers boot fast (see models.create_schema)
+    if WARM_UP, the warm-up runs in the background and /readyz fails until
+    it is over
+'''
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
-  setup_db(app)
+  config = test_config or {}
+  setup_auth(config.get('AUTH0_DOMAIN'), config.get('API_AUDIENCE'))
+  setup_db(app, config.get('DATABASE_URL'), config.get('DATABASE_REPLICA_URLS'))
   CORS(app)
+  app.after_request(add_server_timing)
+
+  app.extensions['warm_up'] = None
+  if config.get('WARM_UP', WARM_UP):
+    start_warm_up(app)
 
 
   '''
@@ -19,18 +575,28 @@ def create_app(test_config=None):
       GET /movies
           This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
           it should require the 'get:movies' permission
-      returns status code 200 and json {"success": True, "movies": movies} where movies is the list of movies
+          it should be paginated by ?limit=&after=<id>, or stream every movie if ?all=true
+          it should filter by ?released_after=&released_before=&title_prefix= and sort by ?sort=[-]id|title|release_date
+          it should embed the cast of every movie if ?include=actors
+      returns status code 200 and json {"success": True, "movies": movies, "next_cursor": cursor} where movies is the page of movies
+          and cursor is the after=<id> of the next page or null on the last page
           or appropriate status code indicating reason for failure
   '''
   @app.route('/movies', methods=['GET'])
   @requires_auth('get:movies')
+  @cached('movies', 'castings', 'actors')
   def get_movies(payload):
-    movies = Movie.query.order_by(Movie.id).all()
-    movies = [movie.format() for movie in movies]
+    include = wants_include(Movie)
+    if wants_all():
+      return stream_all(Movie, 'movies', include)
+
+    movies, next_cursor = paginate(Movie)
+    movies = format_rows(Movie, movies, include)
 
     return jsonify({
       'success': True,
-      'movies': movies
+      'movies': movies,
+      'next_cursor': next_cursor
     })
 
 
@@ -39,18 +605,309 @@ def create_app(test_config=None):
       GET /actors
           This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
           it should require the 'get:actors' permission
-      returns status code 200 and json {"success": True, "actors": actors} where actors is the list of actors
+          it should be paginated by ?limit=&after=<id>, or stream every actor if ?all=true
+          it should filter by ?gender=&min_age=&max_age= and sort by ?sort=[-]id|name|age
+          it should embed the filmography of every actor if ?include=movies
+      returns status code 200 and json {"success": True, "actors": actors, "next_cursor": cursor} where actors is the page of actors
+          and cursor is the after=<id> of the next page or null on the last page
           or appropriate status code indicating reason for failure
   '''
   @app.route('/actors', methods=['GET'])
   @requires_auth('get:actors')
+  @cached('actors', 'castings', 'movies')
   def get_actors(payload):
-    actors = Actor.query.order_by(Actor.id).all()
-    actors = [actor.format() for actor in actors]
+    include = wants_include(Actor)
+    if wants_all():
+      return stream_all(Actor, 'actors', include)
+
+    actors, next_cursor = paginate(Actor)
+    actors = format_rows(Actor, actors, include)
 
     return jsonify({
       'success': True,
-      'actors': actors
+      'actors': actors,
+      'next_cursor': next_cursor
+    })
+
+
+  '''
+      implement endpoint
+      GET /movies/<movie_id>
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:movies' permission
+          it should respond with a 404 error if <movie_id> is not found
+      returns status code 200 and json {"success": True, "movies": movie} where movie is an array containing only the movie
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/<int:movie_id>', methods=['GET'])
+  @requires_auth('get:movies')
+  @cached('movies', row=Movie)
+  def get_movie(payload, movie_id):
+    movie = db.session.query(*Movie.read_columns()).filter(Movie.id == movie_id).one_or_none()
+    if movie is None:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'movies': [Movie.format_row(movie)]
+    })
+
+
+  '''
+      implement endpoint
+      GET /actors/<actor_id>
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:actors' permission
+          it should respond with a 404 error if <actor_id> is not found
+      returns status code 200 and json {"success": True, "actors": actor} where actor is an array containing only the actor
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/<int:actor_id>', methods=['GET'])
+  @requires_auth('get:actors')
+  @cached('actors', row=Actor)
+  def get_actor(payload, actor_id):
+    actor = db.session.query(*Actor.read_columns()).filter(Actor.id == actor_id).one_or_none()
+    if actor is None:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'actors': [Actor.format_row(actor)]
+    })
+
+
+  '''
+      implement endpoint
+      GET /movies/search
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:movies' permission
+          it should find the movies whose title is similar to ?q=, including partial and misspelled titles
+          it should return at most ?limit= movies
+      returns status code 200 and json {"success": True, "movies": movies} where movies are the matching movies
+          with their similarity score, best matches first
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/search', methods=['GET'])
+  @requires_auth('get:movies')
+  @cached('movies')
+  def search_movies(payload):
+    return jsonify({
+      'success': True,
+      'movies': search_results(Movie, Movie.title)
+    })
+
+
+  '''
+      implement endpoint
+      GET /actors/search
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:actors' permission
+          it should find the actors whose name is similar to ?q=, including partial and misspelled names
+          it should return at most ?limit= actors
+      returns status code 200 and json {"success": True, "actors": actors} where actors are the matching actors
+          with their similarity score, best matches first
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/search', methods=['GET'])
+  @requires_auth('get:actors')
+  @cached('actors')
+  def search_actors(payload):
+    return jsonify({
+      'success': True,
+      'actors': search_results(Actor, Actor.name)
+    })
+
+
+  '''
+      implement endpoint
+      GET /movies/<movie_id>/actors
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:movies' permission
+          it should respond with a 404 error if <movie_id> is not found
+      returns status code 200 and json {"success": True, "actors": actors} where actors is the cast of the movie
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/<int:movie_id>/actors', methods=['GET'])
+  @requires_auth('get:movies')
+  @cached('movies', 'castings', 'actors')
+  def get_movie_actors(payload, movie_id):
+    return jsonify({
+      'success': True,
+      'actors': related_list(Movie, movie_id)
+    })
+
+
+  '''
+      implement endpoint
+      GET /actors/<actor_id>/movies
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:actors' permission
+          it should respond with a 404 error if <actor_id> is not found
+      returns status code 200 and json {"success": True, "movies": movies} where movies is the filmography of the actor
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/<int:actor_id>/movies', methods=['GET'])
+  @requires_auth('get:actors')
+  @cached('actors', 'castings', 'movies')
+  def get_actor_movies(payload, actor_id):
+    return jsonify({
+      'success': True,
+      'movies': related_list(Actor, actor_id)
+    })
+
+
+  '''
+      implement endpoint
+      PUT /movies/<movie_id>/actors/<actor_id>
+          This endpoint can be accessed by Casting Director and Executive Producer.
+          it should cast the actor in the movie, doing nothing if it already is
+          it should require the 'patch:movies' permission
+          it should respond with a 404 error if <movie_id> or <actor_id> is not found
+      returns status code 200 and json {"success": True, "movie": movie_id, "actor": actor_id}
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/<int:movie_id>/actors/<int:actor_id>', methods=['PUT'])
+  @requires_auth('patch:movies')
+  def assign_movie_actor(payload, movie_id, actor_id):
+    try:
+      assigned = assign_actor(movie_id, actor_id)
+    except:
+      abort(422)
+    if not assigned:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'movie': movie_id,
+      'actor': actor_id
+    })
+
+
+  '''
+      implement endpoint
+      DELETE /movies/<movie_id>/actors/<actor_id>
+          This endpoint can be accessed by Casting Director and Executive Producer.
+          it should remove the actor from the cast of the movie
+          it should require the 'patch:movies' permission
+          it should respond with a 404 error if the actor isn't cast in the movie
+      returns status code 200 and json {"success": True, "movie": movie_id, "actor": actor_id}
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/<int:movie_id>/actors/<int:actor_id>', methods=['DELETE'])
+  @requires_auth('patch:movies')
+  def unassign_movie_actor(payload, movie_id, actor_id):
+    try:
+      unassigned = unassign_actor(movie_id, actor_id)
+    except:
+      abort(422)
+    if not unassigned:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'movie': movie_id,
+      'actor': actor_id
+    })
+
+
+  '''
+      implement endpoint
+      GET /stats
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:actors' and 'get:movies' permissions
+          it should read the counts from the stats rollups instead of the actors and movies tables
+      returns status code 200 and json {"success": True, "actors": actors, "movies": movies} where actors holds
+          the total and the counts by gender and by age bucket, and movies the total and the counts by release year
+  '''
+  @app.route('/stats', methods=['GET'])
+  @requires_auth('get:actors', 'get:movies')
+  @cached('actors', 'movies')
+  def get_stats(payload):
+    stats = format_stats(rollup_counts())
+
+    return jsonify(dict(stats, success=True))
+
+
+  '''
+      implement endpoint
+      GET /healthz
+          This endpoint can be accessed by anyone, for liveness probes.
+          it should neither require a token nor touch the database
+      returns status code 200 and json {"success": True} while the process serves requests
+  '''
+  @app.route('/healthz', methods=['GET'])
+  def get_healthz():
+    return jsonify({'success': True})
+
+
+  '''
+      implement endpoint
+      GET /readyz
+          This endpoint can be accessed by anyone, for readiness probes.
+          it should neither require a token, touch the database nor fetch anything, probes only read the state
+          it should fail until the warm-up, if any, succeeded, which loads the JWKS and retries its failed steps with
+              backoff, and while every connection of the pool is checked out
+          without a warm-up, the JWKS is loaded by the first authenticated request, so it can't gate readiness: a worker
+              kept out of rotation until then would never get one
+      returns status code 200 and json {"success": True, "checks": checks} where checks holds the warm-up state, the
+          milliseconds its steps took, whether the JWKS is loaded and the pool has a free connection,
+          or status code 503 and json {"success": False, "checks": checks} if the worker isn't ready
+  '''
+  @app.route('/readyz', methods=['GET'])
+  def get_readyz():
+    warm_up = app.extensions['warm_up']
+    checks = {
+      'warm_up': warm_up.state if warm_up is not None else 'disabled',
+      'warm_up_ms': warm_up.timings if warm_up is not None else {},
+      'jwks': auth.key_store.ready(),
+      'pool': pool_ready()
+    }
+    if warm_up is not None:
+      ready = warm_up.done() and checks['jwks'] and checks['pool']
+    else:
+      ready = checks['pool']
+
+    response = jsonify({
+      'success': ready,
+      'checks': checks
+    })
+    response.status_code = 200 if ready else 503
+    return response
+
+
+  '''
+      implement endpoint
+      GET /stats/cache
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:actors' and 'get:movies' permissions
+      returns status code 200 and json {"success": True, "cache": stats} where stats holds the number of entries and bytes
+          of the response cache of this process, its limits, hits, misses, hit rate and evictions
+  '''
+  @app.route('/stats/cache', methods=['GET'])
+  @requires_auth('get:actors', 'get:movies')
+  def get_cache_stats(payload):
+    return jsonify({
+      'success': True,
+      'cache': cache_stats()
+    })
+
+
+  '''
+      implement endpoint
+      GET /stats/pool
+          This endpoint can be accessed by Casting Assistant, Casting Director, and Executive Producer.
+          it should require the 'get:actors' and 'get:movies' permissions
+          it should not touch the database
+      returns status code 200 and json {"success": True, "pools": stats} where stats holds, for the primary and every
+          read replica of this process, the pool size, checked out connections, saturation, checkouts, timeouts and
+          the average and maximum checkout wait
+  '''
+  @app.route('/stats/pool', methods=['GET'])
+  @requires_auth('get:actors', 'get:movies')
+  def get_pool_stats(payload):
+    return jsonify({
+      'success': True,
+      'pools': pool_stats()
     })
 
 
@@ -71,22 +928,14 @@ def create_app(test_config=None):
     if body is None:
       abort(400)
 
-    # Get movie data from request's json body
-    title =  body.get('title', None)
-    release_date = body.get('release_date', None)
-
-    # If movie data isn't available in the request's json body return 400
-    if title is None or release_date is None:
-      abort(400)
-
-    # Proccess release_date and return 400 if not valid
+    # Validate the movie data and return 400 if it isn't valid
     try:
-      release_date = datetime.strptime(release_date, "%B %d, %Y").date()
-    except:
+      movie = parse_movie(body)
+    except ValueError:
       abort(400)
 
     # Add the new movie to the movies table
-    movie = Movie(title=title, release_date=release_date)
+    movie = Movie(**movie)
     try:
       movie.insert()
       return jsonify({
@@ -114,25 +963,17 @@ def create_app(test_config=None):
     if body is None:
       abort(400)
 
-    # Get actor data from request's json body
-    name =  body.get('name', None)
-    age = body.get('age', None)
-    gender = body.get('gender', None)
-
-    # If actor data isn't available in the request's json body return 400
-    if name is None or age is None or gender is None:
-      abort(400)
-
-    # Proccess gender and return 400 if not valid
-    if gender == 'male':
-      gender = True
-    elif gender == 'female':
-      gender = False
-    else:
+    # Validate the actor data and return 400 if it isn't valid, or 422
+    # if a value has the wrong type
+    try:
+      actor = parse_actor(body)
+    except UnprocessableValue:
+      abort(422)
+    except ValueError:
       abort(400)
 
     # Add the new actor to the actors table
-    actor = Actor(name=name, age=age, gender=gender)
+    actor = Actor(**actor)
     try:
       actor.insert()
       return jsonify({
@@ -143,6 +984,96 @@ def create_app(test_config=None):
       abort(422)
 
 
+  '''
+      implement endpoint
+      POST /movies/bulk
+          This endpoint can be accessed by Executive Producer.
+          it should create a row in the movies table for every valid movie in the request's json body {"movies": [...], "atomic": false}
+          it should require the 'post:movies' permission
+      returns status code 200 and json {"success": True, "created": created, "errors": errors} (see bulk_create)
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/bulk', methods=['POST'])
+  @requires_auth('post:movies')
+  def post_movies_bulk(payload):
+    return bulk_create(Movie, 'movies', parse_movie)
+
+
+  '''
+      implement endpoint
+      POST /actors/bulk
+          This endpoint can be accessed by Casting Director, and Executive Producer.
+          it should create a row in the actors table for every valid actor in the request's json body {"actors": [...], "atomic": false}
+          it should require the 'post:actors' permission
+      returns status code 200 and json {"success": True, "created": created, "errors": errors} (see bulk_create)
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/bulk', methods=['POST'])
+  @requires_auth('post:actors')
+  def post_actors_bulk(payload):
+    return bulk_create(Actor, 'actors', parse_actor)
+
+
+  '''
+      implement endpoint
+      PATCH /movies/bulk
+          This endpoint can be accessed by Casting Director, and Executive Producer.
+          it should apply the request's json body {"ids": [...], "patch": {"title", "release_date"}} to every listed movie at once
+          it should require the 'patch:movies' permission
+      returns status code 200 and json {"success": True, "updated": ids, "not_found": ids}
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/bulk', methods=['PATCH'])
+  @requires_auth('patch:movies')
+  def update_movies_bulk(payload):
+    return bulk_update(Movie, parse_movie)
+
+
+  '''
+      implement endpoint
+      PATCH /actors/bulk
+          This endpoint can be accessed by Casting Director, and Executive Producer.
+          it should apply the request's json body {"ids": [...], "patch": {"name", "age", "gender"}} to every listed actor at once
+          it should require the 'patch:actors' permission
+      returns status code 200 and json {"success": True, "updated": ids, "not_found": ids}
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/bulk', methods=['PATCH'])
+  @requires_auth('patch:actors')
+  def update_actors_bulk(payload):
+    return bulk_update(Actor, parse_actor)
+
+
+  '''
+      implement endpoint
+      DELETE /movies/bulk
+          This endpoint can be accessed by Executive Producer.
+          it should delete every movie listed in the request's json body {"ids": [...]} at once
+          it should require the 'delete:movies' permission
+      returns status code 200 and json {"success": True, "deleted": ids, "not_found": ids}
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/movies/bulk', methods=['DELETE'])
+  @requires_auth('delete:movies')
+  def delete_movies_bulk(payload):
+    return bulk_delete(Movie)
+
+
+  '''
+      implement endpoint
+      DELETE /actors/bulk
+          This endpoint can be accessed by Casting Director, and Executive Producer.
+          it should delete every actor listed in the request's json body {"ids": [...]} at once
+          it should require the 'delete:actors' permission
+      returns status code 200 and json {"success": True, "deleted": ids, "not_found": ids}
+          or appropriate status code indicating reason for failure
+  '''
+  @app.route('/actors/bulk', methods=['DELETE'])
+  @requires_auth('delete:actors')
+  def delete_actors_bulk(payload):
+    return bulk_delete(Actor)
+
+
   '''
       implement endpoint
       PATCH /movies/<id>
@@ -157,44 +1088,22 @@ def create_app(test_config=None):
   @app.route('/movies/<int:movie_id>', methods=['PATCH'])
   @requires_auth('patch:movies')
   def update_movie(payload, movie_id):
-    # Query database for required movie
-    movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
-    if movie is None:
-      abort(404)
-
     # Get the request's json body and verify its data
-    body = request.get_json()
-    if body is None:
-      abort(400)
-
-    title = body.get('title', None)
-    release_date = body.get('release_date', None)
-
-    if title is None and release_date is None:
-      abort(400)
-
-    # Update the movie's title
-    if title is not None:
-      movie.title = title
-    
-    # Update the movie's release date
-    if release_date is not None:
-      # Proccess release_date and return 400 if not valid
-      try:
-        movie.release_date = datetime.strptime(release_date, "%B %d, %Y").date()
-      except:
-        abort(400)
+    values = parse_patch(Movie, parse_movie, movie_id)
 
-    # Commit updates to database
+    # Update the movie with a single UPDATE ... RETURNING statement,
+    # no row returned means the movie doesn't exist
     try:
-      movie.update()
-
-      return jsonify({
-        'success': True,
-        'movies': [movie.format()]
-      })
+      movies = update_rows(Movie, [movie_id], values)
     except:
       abort(422)
+    if not movies:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'movies': [Movie.format_row(movies[0])]
+    })
 
 
   '''
@@ -211,50 +1120,22 @@ def create_app(test_config=None):
   @app.route('/actors/<int:actor_id>', methods=['PATCH'])
   @requires_auth('patch:actors')
   def update_actor(payload, actor_id):
-    # Query database for required movie
-    actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
-    if actor is None:
-      abort(404)
-
     # Get the request's json body and verify its data
-    body = request.get_json()
-    if body is None:
-      abort(400)
-
-    name = body.get('name', None)
-    age = body.get('age', None)
-    gender = body.get('gender', None)
+    values = parse_patch(Actor, parse_actor, actor_id)
 
-    if name is None and age is None and gender is None:
-      abort(400)
-
-    # Update the actor's name
-    if name is not None:
-      actor.name = name
-
-    # Update the actor's age
-    if age is not None:
-      actor.age = age
-    
-    # Update the actor's gender
-    if gender is not None:
-      if gender == 'male':
-        actor.gender = True
-      elif gender == 'female':
-        actor.gender = False
-      else:
-        abort(400)
-
-    # Commit updates to database
+    # Update the actor with a single UPDATE ... RETURNING statement,
+    # no row returned means the actor doesn't exist
     try:
-      actor.update()
-
-      return jsonify({
-        'success': True,
-        'actors': [actor.format()]
-      })
+      actors = update_rows(Actor, [actor_id], values)
     except:
       abort(422)
+    if not actors:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'actors': [Actor.format_row(actors[0])]
+    })
 
   '''
       implement endpoint
@@ -270,21 +1151,19 @@ def create_app(test_config=None):
   @app.route('/movies/<int:movie_id>', methods=['DELETE'])
   @requires_auth('delete:movies')
   def delete_movie(payload, movie_id):
-    # Query database for required movie
-    movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
-    if movie is None:
-      abort(404)
-
-    # Delete the row from the database
+    # Delete the row with a single DELETE ... RETURNING statement,
+    # no id returned means the movie doesn't exist
     try:
-      movie.delete()
-
-      return jsonify({
-        'success': True,
-        'delete': movie_id
-      })
+      deleted = delete_rows(Movie, [movie_id])
     except:
       abort(422)
+    if not deleted:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'delete': movie_id
+    })
 
 
   '''
@@ -301,21 +1180,19 @@ def create_app(test_config=None):
   @app.route('/actors/<int:actor_id>', methods=['DELETE'])
   @requires_auth('delete:actors')
   def delete_actor(payload, actor_id):
-    # Query database for required movie
-    actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
-    if actor is None:
-      abort(404)
-
-    # Delete the row from the database
+    # Delete the row with a single DELETE ... RETURNING statement,
+    # no id returned means the actor doesn't exist
     try:
-      actor.delete()
-
-      return jsonify({
-        'success': True,
-        'delete': actor_id
-      })
+      deleted = delete_rows(Actor, [actor_id])
     except:
       abort(422)
+    if not deleted:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'delete': actor_id
+    })
 
 
   # Error Handling
@@ -366,7 +1243,5 @@ def create_app(test_config=None):
 
   return app
 
-app = create_app()
-
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
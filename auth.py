@@ -1,14 +1,39 @@
 import os
 import json
-from flask import request, _request_ctx_stack
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from flask import request, g, _request_ctx_stack
 from functools import wraps
-from jose import jwt
+from jose import jwk, jwt
 from urllib.request import urlopen
 
 
-AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
+# Resolved by setup_auth when the app is created, so importing this module
+# doesn't require them
+AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
 ALGORITHMS = ['RS256']
-API_AUDIENCE = os.environ['API_AUDIENCE']
+API_AUDIENCE = os.environ.get('API_AUDIENCE')
+
+# URL the keys are fetched from, the JWKS of the AUTH0_DOMAIN tenant by default
+JWKS_URL = os.environ.get('JWKS_URL')
+# Seconds a fetched JWKS is considered fresh
+JWKS_TTL = int(os.environ.get('JWKS_TTL', 600))
+# Seconds past the TTL during which stale keys are still served
+# while a background refresh runs
+JWKS_STALE_TTL = int(os.environ.get('JWKS_STALE_TTL', 3600))
+# Minimum seconds between refetches, inline or in the background
+JWKS_MIN_REFETCH_INTERVAL = int(os.environ.get('JWKS_MIN_REFETCH_INTERVAL', 30))
+# Seconds a JWKS fetch may take before it is abandoned
+JWKS_FETCH_TIMEOUT = float(os.environ.get('JWKS_FETCH_TIMEOUT', 5))
+# Maximum number of verified tokens kept in memory
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+# Expose the requires_auth timing breakdown in a Server-Timing header
+AUTH_SERVER_TIMING = os.environ.get('AUTH_SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+
+logger = logging.getLogger(__name__)
 
 ## AuthError Exception
 '''
@@ -21,6 +46,292 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## JWKS Key Store
+
+'''
+JWKS fetchers
+A fetcher is any callable taking no arguments and returning the parsed
+JWKS document ({'keys': [...]}).
+'''
+def url_jwks_fetcher(url, timeout=JWKS_FETCH_TIMEOUT):
+    def fetch():
+        jsonurl = urlopen(url, timeout=timeout)
+        return json.loads(jsonurl.read())
+
+    return fetch
+
+
+def auth0_jwks_url(domain=None):
+    # Without a domain, JWKS_URL or the domain set by setup_auth
+    if domain is None and JWKS_URL:
+        return JWKS_URL
+    return f'https://{domain or AUTH0_DOMAIN}/.well-known/jwks.json'
+
+
+def auth0_jwks_fetcher(domain=None):
+    # The url is resolved on every fetch
+    def fetch():
+        return url_jwks_fetcher(auth0_jwks_url(domain))()
+
+    return fetch
+
+
+def file_jwks_fetcher(path):
+    def fetch():
+        with open(path) as f:
+            return json.load(f)
+
+    return fetch
+
+
+'''
+JWKSKeyStore
+Keeps the JWKS in process so protected requests don't pay for an
+outbound HTTPS round trip.
+    keys younger than ttl are served as is
+    keys older than ttl but younger than ttl + stale_ttl are served while
+        a single background thread refreshes them (stale-while-revalidate)
+    keys older than that, or no keys at all, are refreshed before being
+        served
+    an unknown kid triggers an immediate refetch
+    the refetches made while serving a request and the background
+        refreshes are single-flight and happen at most once every
+        min_refetch_interval seconds, so bad tokens or an Auth0 outage
+        can't flood Auth0 or block every request
+    every key is parsed into a ready to use public key once per refresh,
+        so jwt.decode doesn't rebuild it from the modulus and exponent
+'''
+class JWKSKeyStore:
+    def __init__(self, fetcher, ttl=JWKS_TTL, stale_ttl=JWKS_STALE_TTL,
+                 min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL,
+                 clock=time.monotonic):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.clock = clock
+        self._keys = None
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self):
+        with self._lock:
+            self._last_attempt = self.clock()
+        self.load(self.fetcher())
+
+    def load(self, jwks):
+        # Also takes documents fetched elsewhere
+        keys = {}
+        for key in jwks['keys']:
+            try:
+                public_key = jwk.construct({
+                    'kty': key['kty'],
+                    'kid': key['kid'],
+                    'use': key['use'],
+                    'n': key['n'],
+                    'e': key['e']
+                }, ALGORITHMS[0])
+            except Exception:
+                # Not an RSA signing key, it can't verify our tokens
+                continue
+            keys[key['kid']] = (key, public_key)
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = self.clock()
+            # Keys loaded from elsewhere count as an attempt too, so an
+            # unknown kid right after doesn't refetch the same document
+            self._last_attempt = self._fetched_at
+
+    def _attempted_recently(self):
+        # Called with self._lock held
+        return (self._last_attempt is not None
+                and self.clock() - self._last_attempt < self.min_refetch_interval)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing or self._attempted_recently():
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the stale keys, a lookup after
+                # min_refetch_interval retries
+                logger.warning('JWKS background refresh failed', exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _refetch(self):
+        # One thread fetches at a time, the others wait for it and then
+        # find the attempt too recent to fetch again
+        with self._fetch_lock:
+            with self._lock:
+                if self._attempted_recently():
+                    return
+            try:
+                self.refresh()
+            except Exception:
+                # Auth0 is unreachable, fall back to the keys we have
+                logger.warning('JWKS refetch failed', exc_info=True)
+
+    def _ensure_fresh(self):
+        with self._lock:
+            fetched_at = self._fetched_at
+        if fetched_at is None:
+            self._refetch()
+            return
+
+        age = self.clock() - fetched_at
+        if age >= self.ttl + self.stale_ttl:
+            self._refetch()
+        elif age >= self.ttl:
+            self._refresh_in_background()
+
+    def _lookup(self, kid):
+        self._ensure_fresh()
+        entry = (self._keys or {}).get(kid)
+        if entry is not None or self._keys is None:
+            return entry
+
+        # Unknown kid, the keys may have been rotated
+        self._refetch()
+        return (self._keys or {}).get(kid)
+
+    def ready(self):
+        return self._keys is not None
+
+    def get_key(self, kid):
+        entry = self._lookup(kid)
+        return entry[0] if entry is not None else None
+
+    def get_public_key(self, kid):
+        entry = self._lookup(kid)
+        return entry[1] if entry is not None else None
+
+
+key_store = JWKSKeyStore(auth0_jwks_fetcher())
+
+'''
+set_key_store(store)
+    replaces the key store used by verify_decode_jwt,
+    i.e. to point it at a local JWKS file in tests
+'''
+def set_key_store(store):
+    global key_store
+    key_store = store
+
+
+'''
+setup_auth(domain=None, audience=None)
+    sets the Auth0 domain and the API audience the tokens are verified
+    against, read from the AUTH0_DOMAIN and API_AUDIENCE environment
+    variables when not given
+    it should raise a KeyError if one of them is missing
+'''
+def setup_auth(domain=None, audience=None):
+    global AUTH0_DOMAIN, API_AUDIENCE
+    AUTH0_DOMAIN = domain or os.environ['AUTH0_DOMAIN']
+    API_AUDIENCE = audience or os.environ['API_AUDIENCE']
+
+
+## Verified Token Cache
+
+'''
+TokenCache
+Bounded LRU of decoded payloads for tokens that already passed
+verify_decode_jwt, so a repeated bearer token skips the RSA signature
+and claims check.
+    entries are keyed by the sha256 of the token, raw tokens aren't kept
+    an entry is only served while its 'exp' claim hasn't passed, using
+        the same rule as jwt.decode
+    evict(token) and evict_where(predicate) drop entries on revocation
+'''
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                return None
+            if payload['exp'] < int(self.clock()):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, token, payload):
+        # Tokens without an expiry are always verified again
+        if self.maxsize <= 0 or 'exp' not in payload:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, token):
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def evict_where(self, predicate):
+        with self._lock:
+            for key in [key for key, payload in self._entries.items()
+                        if predicate(payload)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+token_cache = TokenCache()
+
+'''
+set_token_cache(cache)
+    replaces the verified token cache used by verify_decode_jwt,
+    i.e. TokenCache(maxsize=0) disables it
+'''
+def set_token_cache(cache):
+    global token_cache
+    token_cache = cache
+
+
+'''
+revoke_token(token)
+    drops a token from the verified token cache so it is verified again
+revoke_subject(sub)
+    drops every cached token issued to the user with the given subject
+'''
+def revoke_token(token):
+    token_cache.evict(token)
+
+
+def revoke_subject(sub):
+    token_cache.evict_where(lambda payload: payload.get('sub') == sub)
+
+
 ## Auth Header
 
 '''
@@ -92,43 +403,48 @@ def check_permissions(permission, payload):
     implement verify_decode_jwt(token) method
     @INPUTS
         token: a json web token (string)
+        timings: optional dict receiving the seconds spent in the
+            'token_cache', 'jwks' and 'decode' stages
 
+    it should return the cached payload of a token it already verified
     it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
+    it should verify the token using the keys cached from Auth0 /.well-known/jwks.json
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
 '''
-def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+def verify_decode_jwt(token, timings=None):
+    if timings is None:
+        timings = {}
+
+    start = time.perf_counter()
+    payload = token_cache.get(token)
+    timings['token_cache'] = time.perf_counter() - start
+    if payload is not None:
+        return payload
+
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
+    start = time.perf_counter()
+    public_key = key_store.get_public_key(unverified_header['kid'])
+    timings['jwks'] = time.perf_counter() - start
+    if public_key is not None:
+        start = time.perf_counter()
         try:
             payload = jwt.decode(
                 token,
-                rsa_key,
+                public_key,
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
             )
 
+            token_cache.set(token, payload)
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -148,29 +464,78 @@ def verify_decode_jwt(token):
                 'description': 'Unable to parse authentication token.'
             }, 400)
 
+        finally:
+            timings['decode'] = time.perf_counter() - start
+
     raise AuthError({
                 'code': 'invalid_header',
                 'description': 'Unable to find the appropriate key.'
             }, 400)
 
 '''
-    implement @requires_auth(permission) decorator method
+    implement @requires_auth(permission, *permissions) decorator method
     @INPUTS
         permission: string permission (i.e. 'post:movies')
+        permissions: more permissions the token must also have
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
-    it should use the check_permissions method validate claims and check the requested permission
+    it should use the check_permissions method validate claims and check every requested permission
+        before the decorated method, or a decorator under this one like cache.cached, runs
+    it should record the time spent in every stage in g.auth_timings
     return the decorator which passes the decoded payload to the decorated method
 '''
-def requires_auth(permission=''):
+def requires_auth(permission='', *permissions):
+    permissions = (permission,) + permissions
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            timings = {}
+            g.auth_timings = timings
+            start = time.perf_counter()
+            try:
+                token = get_token_auth_header()
+                timings['header'] = time.perf_counter() - start
+
+                payload = verify_decode_jwt(token, timings)
+                stage = time.perf_counter()
+                for required in permissions:
+                    check_permissions(required, payload)
+                timings['permissions'] = time.perf_counter() - stage
+            finally:
+                timings['total'] = time.perf_counter() - start
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('requires_auth(%s) timings: %s', ', '.join(permissions),
+                                 format_auth_timings(timings))
             return f(payload, *args, **kwargs)
 
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
+
+
+## Auth Timing
+
+'''
+format_auth_timings(timings)
+    formats a stage -> seconds dict as a Server-Timing header value,
+    i.e. 'auth-header;dur=0.010, auth-decode;dur=0.071, auth;dur=0.094'
+'''
+def format_auth_timings(timings):
+    metrics = []
+    for stage, seconds in timings.items():
+        name = 'auth' if stage == 'total' else 'auth-' + stage.replace('_', '-')
+        metrics.append('%s;dur=%.3f' % (name, seconds * 1000))
+    return ', '.join(metrics)
+
+
+'''
+add_server_timing(response)
+    after_request hook adding the requires_auth timing breakdown of the
+    current request to the Server-Timing header, if AUTH_SERVER_TIMING is set
+'''
+def add_server_timing(response):
+    timings = g.get('auth_timings')
+    if AUTH_SERVER_TIMING and timings:
+        response.headers.add('Server-Timing', format_auth_timings(timings))
+    return response
\ No newline at end of file
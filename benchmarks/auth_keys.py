@@ -0,0 +1,66 @@
+'''
+Micro-benchmark of the JWT signature check with and without the public
+keys prepared by the JWKS key store.
+    legacy:   scan jwks['keys'] for the kid, build an rsa_key dict and let
+              jwt.decode parse the modulus and exponent again
+    prepared: hand jwt.decode the public key built once per refresh
+
+Run it from the project directory:
+    python -m benchmarks.auth_keys [iterations]
+'''
+import sys
+
+from jose import jwt
+
+import auth
+from benchmarks.common import (
+    BENCH_DOMAIN, BENCH_AUDIENCE, generate_signing_key, sign_token, timeit, summarize, print_summary)
+
+
+def main(iterations=2000):
+    auth.setup_auth(BENCH_DOMAIN, BENCH_AUDIENCE)
+    pem, jwks = generate_signing_key('bench-key')
+    # Pad the key set the way a tenant with rotated keys looks
+    jwks['keys'] = [dict(jwks['keys'][0], kid='old-%d' % i) for i in range(3)] + jwks['keys']
+    token = sign_token(pem, 'bench-key', auth.AUTH0_DOMAIN, auth.API_AUDIENCE, ['get:movies'])
+    store = auth.JWKSKeyStore(lambda: jwks)
+    issuer = 'https://' + auth.AUTH0_DOMAIN + '/'
+
+    def legacy():
+        kid = jwt.get_unverified_header(token)['kid']
+        rsa_key = {}
+        for key in jwks['keys']:
+            if key['kid'] == kid:
+                rsa_key = {
+                    'kty': key['kty'],
+                    'kid': key['kid'],
+                    'use': key['use'],
+                    'n': key['n'],
+                    'e': key['e']
+                }
+        jwt.decode(token, rsa_key, algorithms=auth.ALGORITHMS,
+                   audience=auth.API_AUDIENCE, issuer=issuer)
+
+    def prepared():
+        kid = jwt.get_unverified_header(token)['kid']
+        jwt.decode(token, store.get_public_key(kid), algorithms=auth.ALGORITHMS,
+                   audience=auth.API_AUDIENCE, issuer=issuer)
+
+    # Warm up both paths
+    legacy()
+    prepared()
+
+    results = [
+        summarize('legacy rsa_key dict', timeit(legacy, iterations)),
+        summarize('prepared public key', timeit(prepared, iterations))
+    ]
+    for result in results:
+        print_summary(result)
+
+    saved = results[0]['p50_ms'] - results[1]['p50_ms']
+    print('per request savings at p50: %.3fms' % saved)
+    return results
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,106 @@
+'''
+Benchmark of the requires_auth hot path, with and without caching.
+Tokens are signed with a local RSA key and the JWKS is served by a local
+HTTP server, so the uncached scenario pays for a real JWKS round trip on
+every request the way verify_decode_jwt used to.
+    uncached:    JWKS fetched and token verified on every request
+    jwks cached: JWKS kept in the key store, token verified every request
+    all cached:  JWKS kept in the key store, repeated tokens served from
+                 the verified token cache
+
+Run it from the project directory:
+    python -m benchmarks.auth_throughput [requests]
+'''
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from flask import Flask, g, jsonify
+
+import auth
+from benchmarks.common import (
+    BENCH_DOMAIN, BENCH_AUDIENCE, generate_signing_key, sign_token, timeit, summarize, print_summary)
+
+
+'''
+serve_jwks(jwks)
+    serves jwks at http://127.0.0.1:<port>/.well-known/jwks.json
+    from a daemon thread and returns the server
+'''
+def serve_jwks(jwks):
+    body = json.dumps(jwks).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_bench_app(stage_samples):
+    app = Flask(__name__)
+
+    @app.route('/protected')
+    @auth.requires_auth('get:movies')
+    def protected(payload):
+        stage_samples.append(dict(g.auth_timings))
+        return jsonify({'success': True})
+
+    return app
+
+
+def main(requests=1000):
+    auth.setup_auth(BENCH_DOMAIN, BENCH_AUDIENCE)
+    pem, jwks = generate_signing_key('bench-key')
+    server = serve_jwks(jwks)
+    jwks_url = 'http://127.0.0.1:%d/.well-known/jwks.json' % server.server_port
+    token = sign_token(pem, 'bench-key', auth.AUTH0_DOMAIN, auth.API_AUDIENCE, ['get:movies'])
+    headers = {'Authorization': 'Bearer ' + token}
+
+    scenarios = [
+        ('uncached', dict(ttl=0, stale_ttl=0), 0),
+        ('jwks cached', {}, 0),
+        ('all cached', {}, auth.TOKEN_CACHE_SIZE)
+    ]
+    results = []
+    for name, store_options, cache_size in scenarios:
+        auth.set_key_store(auth.JWKSKeyStore(auth.url_jwks_fetcher(jwks_url), **store_options))
+        auth.set_token_cache(auth.TokenCache(maxsize=cache_size))
+        stage_samples = []
+        client = create_bench_app(stage_samples).test_client()
+
+        def request():
+            response = client.get('/protected', headers=headers)
+            assert response.status_code == 200, response.data
+
+        # Warm up the caches of the scenario
+        request()
+        stage_samples.clear()
+
+        result = summarize(name, timeit(request, requests))
+        result['stages_ms'] = {
+            stage: sum(sample.get(stage, 0) for sample in stage_samples) / len(stage_samples) * 1000
+            for stage in ('header', 'token_cache', 'jwks', 'decode', 'permissions', 'total')
+        }
+        results.append(result)
+
+    server.shutdown()
+    for result in results:
+        print_summary(result)
+        print('    mean stage ms: ' + ', '.join(
+            '%s %.3f' % (stage, ms) for stage, ms in result['stages_ms'].items()))
+    return results
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,114 @@
+'''
+Benchmark of the cold start of a worker, each run in a fresh interpreter:
+    import:        import app
+    create_app:    the application factory
+    first_request: the first GET /movies, connecting to the database and
+                   fetching the JWKS
+    warm_request:  the next GET /movies
+    process:       interpreter start to first response, as seen by the parent
+Two boots are compared:
+    lazy:       create_app() only, the schema is created by manage.py
+    create_all: create_app() then create_schema(), what every worker used
+                to do when it booted
+
+The tables are created in BENCH_DATABASE_URL, a throwaway SQLite file by
+default. Run it from the project directory:
+    python -m benchmarks.cold_start [runs]
+'''
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+from flask import Flask
+
+from models import setup_db, create_schema
+from benchmarks.common import (
+    BENCH_DOMAIN, BENCH_AUDIENCE, generate_signing_key, sign_token, percentile)
+
+
+# Runs in the child interpreter, which must not import anything up front
+CHILD = '''
+import os, sys, json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+import auth, models
+flask_app = app.create_app()
+if os.environ['BENCH_BOOT'] == 'create_all':
+    with flask_app.app_context():
+        models.create_schema()
+created = time.perf_counter()
+auth.set_key_store(auth.JWKSKeyStore(auth.file_jwks_fetcher(os.environ['BENCH_JWKS_PATH'])))
+client = flask_app.test_client()
+headers = {'Authorization': 'Bearer ' + os.environ['BENCH_TOKEN']}
+response = client.get('/movies', headers=headers)
+assert response.status_code == 200, response.data
+first = time.perf_counter()
+response = client.get('/movies?limit=10', headers=headers)
+assert response.status_code == 200, response.data
+warm = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first - created) * 1000,
+    'warm_request_ms': (warm - first) * 1000
+}))
+'''
+
+STAGES = ('import_ms', 'create_app_ms', 'first_request_ms', 'warm_request_ms', 'process_ms')
+
+
+'''
+boot(boot_mode, env)
+    starts a fresh interpreter running CHILD and returns its timings
+'''
+def boot(boot_mode, env):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], env=dict(env, BENCH_BOOT=boot_mode),
+                            check=True, stdout=subprocess.PIPE).stdout
+    timings = json.loads(output.decode().strip().splitlines()[-1])
+    timings['process_ms'] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def main(runs=10):
+    directory = tempfile.mkdtemp()
+    database_path = os.environ.get('BENCH_DATABASE_URL')
+    if database_path is None:
+        database_path = 'sqlite:///' + os.path.join(directory, 'bench.db')
+    setup_db(Flask(__name__), database_path)
+    create_schema()
+
+    pem, jwks = generate_signing_key('bench-key')
+    jwks_path = os.path.join(directory, 'jwks.json')
+    with open(jwks_path, 'w') as f:
+        json.dump(jwks, f)
+    env = dict(os.environ,
+               AUTH0_DOMAIN=BENCH_DOMAIN,
+               API_AUDIENCE=BENCH_AUDIENCE,
+               DATABASE_URL=database_path,
+               PYTHONPATH=os.getcwd(),
+               BENCH_JWKS_PATH=jwks_path,
+               BENCH_TOKEN=sign_token(pem, 'bench-key', BENCH_DOMAIN, BENCH_AUDIENCE,
+                                      ['get:movies']))
+
+    results = []
+    for boot_mode in ('lazy', 'create_all'):
+        samples = [boot(boot_mode, env) for _ in range(runs)]
+        result = {'boot': boot_mode, 'runs': runs}
+        for stage in STAGES:
+            values = [sample[stage] for sample in samples]
+            result[stage] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+        results.append(result)
+        print('{:<10} {}'.format(boot_mode, '  '.join(
+            '{} {:>8.1f}/{:<8.1f}'.format(stage[:-3], result[stage]['p50'], result[stage]['p95'])
+            for stage in STAGES)))
+    print('(p50/p95 milliseconds over %d runs)' % runs)
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
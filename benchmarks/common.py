@@ -0,0 +1,76 @@
+import time
+from jose import jwk, jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+# The Auth0 tenant the benchmarks sign and verify their tokens for
+BENCH_DOMAIN = 'bench.auth0.local'
+BENCH_AUDIENCE = 'castingagency'
+
+
+'''
+Helpers shared by the benchmarks
+They run fully offline: tokens are signed with a locally generated RSA
+key whose public half is published as a local JWKS.
+'''
+def generate_signing_key(kid='bench-key'):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption())
+    public_jwk = jwk.construct(pem, 'RS256').public_key().to_dict()
+    public_jwk.update({'kid': kid, 'use': 'sig'})
+    return pem, {'keys': [public_jwk]}
+
+
+def sign_token(pem, kid, domain, audience, permissions, expires_in=3600,
+               subject='auth0|bench'):
+    now = int(time.time())
+    claims = {
+        'iss': 'https://' + domain + '/',
+        'sub': subject,
+        'aud': audience,
+        'iat': now,
+        'exp': now + expires_in,
+        'permissions': permissions
+    }
+    return jwt.encode(claims, pem, algorithm='RS256', headers={'kid': kid})
+
+
+'''
+timeit(fn, iterations)
+    runs fn iterations times and returns the per call latencies in seconds
+'''
+def timeit(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, samples):
+    total = sum(samples)
+    return {
+        'name': name,
+        'calls': len(samples),
+        'ops_per_sec': len(samples) / total if total else 0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000
+    }
+
+
+def print_summary(summary):
+    print('{name:<32} {calls:>8} calls {ops_per_sec:>12.1f} ops/s '
+          'p50 {p50_ms:>8.3f}ms p95 {p95_ms:>8.3f}ms p99 {p99_ms:>8.3f}ms'
+          .format(**summary))
@@ -0,0 +1,356 @@
+'''
+Load and regression benchmark of every route of the app, fully offline:
+tokens are signed by a local RSA key verified against a local JWKS, and
+the database is seeded with --rows movies and actors, each movie casting
+three actors.
+
+Every scenario drives one route at each --concurrency level, from as many
+client threads, and reports the requests/sec and p50/p95/p99 latencies.
+Writes get rows of their own: deletes remove rows created for them, so
+every level measures the same work. The run fails if a route of the app
+has no scenario.
+
+The results can be saved with --output, and compared with a saved run
+with --baseline: a scenario whose throughput dropped, or whose p95 grew,
+by more than --tolerance is flagged as a regression and the exit status
+is 1.
+
+The tables are seeded in BENCH_DATABASE_URL, a throwaway SQLite file by
+default, never point it at a database you care about. Run it from the
+project directory:
+    python -m benchmarks.endpoints --rows 10000 --concurrency 1,8,32 \\
+        --output baseline.json
+    python -m benchmarks.endpoints --rows 10000 --concurrency 1,8,32 \\
+        --baseline baseline.json
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+import auth
+from app import create_app
+from cache import ResponseCache, set_response_cache
+from models import create_schema, db, Movie, Actor, castings
+from benchmarks.common import (
+    BENCH_DOMAIN, BENCH_AUDIENCE, generate_signing_key, sign_token, summarize)
+
+
+PERMISSIONS = ['get:movies', 'get:actors', 'post:movies', 'post:actors', 'patch:movies',
+               'patch:actors', 'delete:movies', 'delete:actors']
+# Rows sent or targeted by every bulk request
+BULK_SIZE = 10
+# Requests run before the measured ones, to warm the caches of a scenario
+WARM_UP_REQUESTS = 5
+
+
+'''
+Scenario(name, method, rule, build, prepare=None)
+    a request of the route rule with method, whose path and json body
+    are build(context, item) for every item of prepare(context, count),
+    by default the numbers up to count
+'''
+class Scenario:
+    def __init__(self, name, method, rule, build, prepare=None):
+        self.name = name
+        self.method = method
+        self.rule = rule
+        self.build = build
+        self.prepare = prepare or (lambda context, count: list(range(count)))
+
+
+'''
+insert_rows(model, count)
+    inserts count generated movies or actors in chunks, and returns
+    their ids
+'''
+def insert_rows(model, count):
+    start = db.session.query(func.max(model.id)).scalar() or 0
+    for offset in range(0, count, 10000):
+        size = min(10000, count - offset)
+        if model is Movie:
+            rows = [{'title': 'Movie %d' % (start + i), 'release_date': date(1950, 1, 1) + timedelta(days=i % 25000)}
+                    for i in range(offset, offset + size)]
+        else:
+            rows = [{'name': 'Actor %d' % (start + i), 'age': 18 + i % 70, 'gender': i % 2 == 0}
+                    for i in range(offset, offset + size)]
+        db.session.execute(model.__table__.insert(), rows)
+    db.session.commit()
+    return [id for id, in db.session.query(model.id).filter(model.id > start).order_by(model.id)]
+
+
+def seed(rows):
+    db.session.execute(castings.delete())
+    db.session.query(Movie).delete()
+    db.session.query(Actor).delete()
+    db.session.commit()
+    movie_ids = insert_rows(Movie, rows)
+    actor_ids = insert_rows(Actor, rows)
+    for offset in range(0, rows, 10000):
+        db.session.execute(castings.insert(), [
+            {'movie_id': movie_ids[i], 'actor_id': actor_ids[(i + j) % rows]}
+            for i in range(offset, min(offset + 10000, rows)) for j in range(3)])
+    db.session.commit()
+    return {'movie_ids': movie_ids, 'actor_ids': actor_ids}
+
+
+def victims(model, per_request=1):
+    # Rows created for the requests deleting them, one list per request
+    def prepare(context, count):
+        with context['app'].app_context():
+            ids = insert_rows(model, count * per_request)
+        return [ids[i:i + per_request] for i in range(0, len(ids), per_request)]
+    return prepare
+
+
+def cast_victims(context, count):
+    with context['app'].app_context():
+        ids = insert_rows(Movie, count)
+        actor_id = context['actor_ids'][0]
+        db.session.execute(castings.insert(), [{'movie_id': id, 'actor_id': actor_id} for id in ids])
+        db.session.commit()
+    return [(id, actor_id) for id in ids]
+
+
+def some(ids, item):
+    return ids[item * 7919 % len(ids)]
+
+
+def new_movie(item):
+    return {'title': 'Benchmark movie %d' % item, 'release_date': 'March 04, 2022'}
+
+
+def new_actor(item):
+    return {'name': 'Benchmark actor %d' % item, 'age': 30 + item % 40, 'gender': 'female'}
+
+
+SCENARIOS = [
+    Scenario('get_movies', 'GET', '/movies', lambda c, i: ('/movies', None)),
+    Scenario('get_movies_page', 'GET', '/movies',
+             lambda c, i: ('/movies?sort=-release_date&limit=100&after=%d' % some(c['movie_ids'], i), None)),
+    Scenario('get_movies_include_actors', 'GET', '/movies',
+             lambda c, i: ('/movies?include=actors&limit=100', None)),
+    Scenario('get_movies_all', 'GET', '/movies', lambda c, i: ('/movies?all=true', None)),
+    Scenario('get_actors', 'GET', '/actors', lambda c, i: ('/actors', None)),
+    Scenario('get_actors_filtered', 'GET', '/actors',
+             lambda c, i: ('/actors?gender=female&min_age=30&sort=age', None)),
+    Scenario('get_movie', 'GET', '/movies/<int:movie_id>',
+             lambda c, i: ('/movies/%d' % some(c['movie_ids'], i), None)),
+    Scenario('get_actor', 'GET', '/actors/<int:actor_id>',
+             lambda c, i: ('/actors/%d' % some(c['actor_ids'], i), None)),
+    Scenario('search_movies', 'GET', '/movies/search',
+             lambda c, i: ('/movies/search?q=Movei%%20%d' % (i % 1000), None)),
+    Scenario('search_actors', 'GET', '/actors/search',
+             lambda c, i: ('/actors/search?q=Acotr%%20%d' % (i % 1000), None)),
+    Scenario('get_movie_actors', 'GET', '/movies/<int:movie_id>/actors',
+             lambda c, i: ('/movies/%d/actors' % some(c['movie_ids'], i), None)),
+    Scenario('get_actor_movies', 'GET', '/actors/<int:actor_id>/movies',
+             lambda c, i: ('/actors/%d/movies' % some(c['actor_ids'], i), None)),
+    Scenario('get_stats', 'GET', '/stats', lambda c, i: ('/stats', None)),
+    Scenario('get_stats_cache', 'GET', '/stats/cache', lambda c, i: ('/stats/cache', None)),
+    Scenario('get_stats_pool', 'GET', '/stats/pool', lambda c, i: ('/stats/pool', None)),
+    Scenario('healthz', 'GET', '/healthz', lambda c, i: ('/healthz', None)),
+    Scenario('readyz', 'GET', '/readyz', lambda c, i: ('/readyz', None)),
+    Scenario('post_movie', 'POST', '/movies', lambda c, i: ('/movies', new_movie(i))),
+    Scenario('post_actor', 'POST', '/actors', lambda c, i: ('/actors', new_actor(i))),
+    Scenario('post_movies_bulk', 'POST', '/movies/bulk',
+             lambda c, i: ('/movies/bulk', {'movies': [new_movie(i) for _ in range(BULK_SIZE)]})),
+    Scenario('post_actors_bulk', 'POST', '/actors/bulk',
+             lambda c, i: ('/actors/bulk', {'actors': [new_actor(i) for _ in range(BULK_SIZE)]})),
+    Scenario('patch_movie', 'PATCH', '/movies/<int:movie_id>',
+             lambda c, i: ('/movies/%d' % some(c['movie_ids'], i), {'title': 'Patched %d' % i})),
+    Scenario('patch_actor', 'PATCH', '/actors/<int:actor_id>',
+             lambda c, i: ('/actors/%d' % some(c['actor_ids'], i), {'age': 20 + i % 50})),
+    Scenario('patch_movies_bulk', 'PATCH', '/movies/bulk',
+             lambda c, i: ('/movies/bulk', {'ids': [some(c['movie_ids'], i + j) for j in range(BULK_SIZE)],
+                                            'patch': {'release_date': 'May 01, 2020'}})),
+    Scenario('patch_actors_bulk', 'PATCH', '/actors/bulk',
+             lambda c, i: ('/actors/bulk', {'ids': [some(c['actor_ids'], i + j) for j in range(BULK_SIZE)],
+                                            'patch': {'age': 40}})),
+    Scenario('delete_movie', 'DELETE', '/movies/<int:movie_id>',
+             lambda c, ids: ('/movies/%d' % ids[0], None), victims(Movie)),
+    Scenario('delete_actor', 'DELETE', '/actors/<int:actor_id>',
+             lambda c, ids: ('/actors/%d' % ids[0], None), victims(Actor)),
+    Scenario('delete_movies_bulk', 'DELETE', '/movies/bulk',
+             lambda c, ids: ('/movies/bulk', {'ids': ids}), victims(Movie, BULK_SIZE)),
+    Scenario('delete_actors_bulk', 'DELETE', '/actors/bulk',
+             lambda c, ids: ('/actors/bulk', {'ids': ids}), victims(Actor, BULK_SIZE)),
+    Scenario('assign_actor', 'PUT', '/movies/<int:movie_id>/actors/<int:actor_id>',
+             lambda c, i: ('/movies/%d/actors/%d' % (some(c['movie_ids'], i), some(c['actor_ids'], i * 3)), None)),
+    Scenario('unassign_actor', 'DELETE', '/movies/<int:movie_id>/actors/<int:actor_id>',
+             lambda c, pair: ('/movies/%d/actors/%d' % pair, None), cast_victims),
+]
+
+
+'''
+uncovered_routes(app, scenarios)
+    returns the (rule, method) of the routes of app no scenario drives
+'''
+def uncovered_routes(app, scenarios):
+    covered = set((scenario.rule, scenario.method) for scenario in scenarios)
+    routes = set((rule.rule, method) for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+                 for method in rule.methods - {'HEAD', 'OPTIONS'})
+    return sorted(routes - covered)
+
+
+def run_scenario(app, context, scenario, concurrency, requests, headers):
+    items = scenario.prepare(context, requests + WARM_UP_REQUESTS)
+    random.Random(0).shuffle(items)
+    errors = []
+
+    def request(item):
+        path, body = scenario.build(context, item)
+        start = time.perf_counter()
+        response = app.test_client().open(path, method=scenario.method, json=body, headers=headers)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            errors.append(response.status_code)
+        return elapsed
+
+    for item in items[:WARM_UP_REQUESTS]:
+        request(item)
+    errors.clear()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(request, items[WARM_UP_REQUESTS:]))
+    elapsed = time.perf_counter() - start
+
+    result = summarize(scenario.name, samples)
+    result.update({
+        'scenario': scenario.name,
+        'route': '%s %s' % (scenario.method, scenario.rule),
+        'concurrency': concurrency,
+        'ops_per_sec': len(samples) / elapsed,
+        'errors': len(errors)
+    })
+    del result['name']
+    return result
+
+
+'''
+compare(results, baseline, tolerance)
+    returns the results whose throughput is lower, or whose p95 is
+    higher, than those of the same scenario and concurrency in the
+    baseline by more than the tolerance, with the baseline values
+'''
+def compare(results, baseline, tolerance):
+    previous = dict(((result['scenario'], result['concurrency']), result) for result in baseline['results'])
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if before is None:
+            continue
+        if (result['ops_per_sec'] < before['ops_per_sec'] * (1 - tolerance) or
+                result['p95_ms'] > before['p95_ms'] * (1 + tolerance)):
+            regressions.append(dict(result, baseline_ops_per_sec=before['ops_per_sec'],
+                                    baseline_p95_ms=before['p95_ms']))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load and regression benchmark of every route')
+    parser.add_argument('--rows', type=int, default=10000, help='movies and actors seeded')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma separated client counts')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario and concurrency')
+    parser.add_argument('--scenarios', default=None, help='comma separated scenarios, all by default')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('--output', default=None, help='file the results are saved to as JSON')
+    parser.add_argument('--baseline', default=None, help='results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative throughput drop or p95 growth flagged as a regression')
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    database_path = os.environ.get('BENCH_DATABASE_URL')
+    if database_path is None:
+        database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'AUTH0_DOMAIN': BENCH_DOMAIN,
+        'API_AUDIENCE': BENCH_AUDIENCE,
+        'DATABASE_URL': database_path
+    })
+    missing = uncovered_routes(app, SCENARIOS)
+    if missing:
+        raise AssertionError('routes without a scenario: %s' % ', '.join('%s %s' % route for route in missing))
+
+    pem, jwks = generate_signing_key('bench-key')
+    auth.set_key_store(auth.JWKSKeyStore(lambda: jwks))
+    auth.set_token_cache(auth.TokenCache())
+    token = sign_token(pem, 'bench-key', auth.AUTH0_DOMAIN, auth.API_AUDIENCE, PERMISSIONS)
+    headers = {'Authorization': 'Bearer ' + token}
+    if not args.cache:
+        set_response_cache(ResponseCache(maxsize=0))
+
+    with app.app_context():
+        create_schema()
+        context = seed(args.rows)
+    context['app'] = app
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        names = args.scenarios.split(',')
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+
+    results = []
+    for scenario in scenarios:
+        for concurrency in levels:
+            result = run_scenario(app, context, scenario, concurrency, args.requests, headers)
+            results.append(result)
+            print('{scenario:<26} c={concurrency:<3} {ops_per_sec:>9.1f} req/s  p50 {p50_ms:>8.2f}ms  '
+                  'p95 {p95_ms:>8.2f}ms  p99 {p99_ms:>8.2f}ms{failed}'.format(
+                      failed='  %d errors' % result['errors'] if result['errors'] else '', **result))
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'database': db.get_engine(app).dialect.name,
+            'rows': args.rows,
+            'requests': args.requests,
+            'concurrency': levels,
+            'response_cache': args.cache,
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    status = 1 if any(result['errors'] for result in results) else 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION {scenario} c={concurrency}: {ops_per_sec:.1f} req/s (baseline '
+                  '{baseline_ops_per_sec:.1f}), p95 {p95_ms:.2f}ms (baseline {baseline_p95_ms:.2f}ms)'
+                  .format(**regression))
+        if regressions:
+            status = 1
+        else:
+            print('no regression against %s' % args.baseline)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
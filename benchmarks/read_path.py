@@ -0,0 +1,96 @@
+'''
+Benchmark of the list endpoints read path.
+    orm:       Model.query.order_by(Model.id).all() and format() per instance
+    projected: select only Model.read_columns() as tuples and format_row()
+Both paths must serialize to byte-identical JSON.
+
+The tables are seeded in BENCH_DATABASE_URL, a throwaway SQLite file by
+default. Run it from the project directory:
+    python -m benchmarks.read_path [rows ...]
+'''
+import os
+import sys
+import time
+import tempfile
+from datetime import date, timedelta
+
+from flask import Flask, json
+
+from models import setup_db, create_schema, db, Movie, Actor
+
+
+'''
+seed(count)
+    replaces the movies and actors tables with count generated rows each
+'''
+def seed(count):
+    db.session.query(Movie).delete()
+    db.session.query(Actor).delete()
+    start = date(1950, 1, 1)
+    batch = 10000
+    for offset in range(0, count, batch):
+        size = min(batch, count - offset)
+        db.session.execute(Movie.__table__.insert(), [
+            {'title': 'Movie %d' % i, 'release_date': start + timedelta(days=i % 25000)}
+            for i in range(offset, offset + size)
+        ])
+        db.session.execute(Actor.__table__.insert(), [
+            {'name': 'Actor %d' % i, 'age': 18 + i % 70, 'gender': i % 2 == 0}
+            for i in range(offset, offset + size)
+        ])
+    db.session.commit()
+
+
+def read_orm(model):
+    rows = model.query.order_by(model.id).all()
+    result = [row.format() for row in rows]
+    # Drop the instances the way a request teardown does
+    db.session.remove()
+    return result
+
+
+def read_projected(model):
+    rows = db.session.query(*model.read_columns()).order_by(model.id).all()
+    result = [model.format_row(row) for row in rows]
+    db.session.remove()
+    return result
+
+
+def measure(fn, model, count):
+    start = time.perf_counter()
+    result = fn(model)
+    elapsed = time.perf_counter() - start
+    return result, count / elapsed
+
+
+def main(counts=(10000, 100000, 1000000)):
+    app = Flask(__name__)
+    database_path = os.environ.get('BENCH_DATABASE_URL')
+    if database_path is None:
+        database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    setup_db(app, database_path)
+    create_schema()
+
+    results = []
+    with app.app_context():
+        for count in counts:
+            seed(count)
+            for model in (Movie, Actor):
+                orm_rows, orm_rate = measure(read_orm, model, count)
+                projected_rows, projected_rate = measure(read_projected, model, count)
+                if json.dumps(orm_rows) != json.dumps(projected_rows):
+                    raise AssertionError('%s read paths serialize differently' % model.__name__)
+                results.append({
+                    'table': model.__tablename__,
+                    'rows': count,
+                    'orm_rows_per_sec': orm_rate,
+                    'projected_rows_per_sec': projected_rate
+                })
+                print('{table:<8} {rows:>9} rows  orm {orm_rows_per_sec:>12.0f} rows/s  '
+                      'projected {projected_rows_per_sec:>12.0f} rows/s  x{speedup:.2f}'
+                      .format(speedup=projected_rate / orm_rate, **results[-1]))
+    return results
+
+
+if __name__ == '__main__':
+    main([int(count) for count in sys.argv[1:]] or (10000, 100000, 1000000))
@@ -0,0 +1,82 @@
+'''
+Benchmark of the serialization of the list endpoints rows, without a
+database.
+    strftime:    Movie dates formatted by strftime('%B %d, %Y') per row
+    format_date: Movie dates formatted by the cached models.format_date
+    stdlib:      format_row() documents encoded by the json module
+    orjson:      format_row() documents encoded by orjson, when installed
+Every encoder must decode to the same documents.
+
+Run it from the project directory:
+    python -m benchmarks.serializer [rows ...]
+'''
+import sys
+import json
+import time
+from datetime import date, timedelta
+
+from models import Movie, Actor, format_date
+from serialization import StdlibJSONProvider, OrjsonJSONProvider, orjson
+
+
+'''
+generate(count)
+    returns count movie and actor rows shaped like Model.read_columns()
+'''
+def generate(count):
+    start = date(1950, 1, 1)
+    movies = [(i, 'Movie %d' % i, start + timedelta(days=i % 25000)) for i in range(count)]
+    actors = [(i, 'Actor %d' % i, 18 + i % 70, i % 2 == 0) for i in range(count)]
+    return movies, actors
+
+
+def format_strftime(rows):
+    return [{'id': id, 'title': title, 'release_date': release_date.strftime('%B %d, %Y')}
+            for id, title, release_date in rows]
+
+
+def measure(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(counts=(10000, 100000, 1000000)):
+    providers = [StdlibJSONProvider()]
+    if orjson is not None:
+        providers.append(OrjsonJSONProvider())
+
+    results = []
+    for count in counts:
+        movies, actors = generate(count)
+        format_date.cache_clear()
+        legacy, strftime_elapsed = measure(format_strftime, movies)
+        formatted, format_elapsed = measure(lambda rows: [Movie.format_row(row) for row in rows], movies)
+        if legacy != formatted:
+            raise AssertionError('format_date formats dates differently than strftime')
+        print('{:<8} {:>9} rows  strftime {:>12.0f} rows/s  format_date {:>12.0f} rows/s  x{:.2f}'
+              .format('dates', count, count / strftime_elapsed, count / format_elapsed,
+                      strftime_elapsed / format_elapsed))
+
+        for model, rows in ((Movie, movies), (Actor, actors)):
+            document = {'success': True, model.__tablename__: [model.format_row(row) for row in rows]}
+            encoded = {}
+            for provider in providers:
+                body, elapsed = measure(provider.dumps, document)
+                encoded[provider.name] = body
+                results.append({
+                    'table': model.__tablename__,
+                    'rows': count,
+                    'provider': provider.name,
+                    'rows_per_sec': count / elapsed,
+                    'mb_per_sec': len(body) / elapsed / 1e6
+                })
+                print('{table:<8} {rows:>9} rows  {provider:<7} {rows_per_sec:>12.0f} rows/s '
+                      '{mb_per_sec:>9.1f} MB/s'.format(**results[-1]))
+            if any(json.loads(body) != document for body in encoded.values()):
+                raise AssertionError('%s providers encode differently' % model.__name__)
+    return results
+
+
+if __name__ == '__main__':
+    main([int(count) for count in sys.argv[1:]] or (10000, 100000, 1000000))
@@ -0,0 +1,161 @@
+'''
+Benchmark matrix of the gunicorn worker models of gunicorn.conf.py, each
+with and without preload_app:
+    boot:   milliseconds until the server answers GET /healthz
+    load:   requests/sec and latency of GET /movies from concurrent
+            keep-alive clients, the response cache disabled so every
+            request queries the database
+    memory: proportional set size (PSS) of the master and its workers,
+            which counts the pages the workers share copy-on-write once
+The gevent mode is skipped when gevent isn't installed. The JWKS is
+served by a local HTTP server (JWKS_URL).
+
+The tables are seeded in BENCH_DATABASE_URL, a throwaway SQLite file by
+default. Run it from the project directory, Linux only for the PSS:
+    python -m benchmarks.server_matrix [workers] [clients] [requests]
+'''
+import os
+import sys
+import time
+import socket
+import signal
+import tempfile
+import subprocess
+import importlib.util
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from app import create_app
+from models import create_schema, db, Movie
+from benchmarks.common import (
+    BENCH_DOMAIN, BENCH_AUDIENCE, generate_signing_key, sign_token, percentile)
+from benchmarks.auth_throughput import serve_jwks
+
+
+MODES = (('sync', None), ('threaded', None), ('gevent', 'gevent'))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+'''
+pss_kb(pid)
+    returns the proportional set size of pid and of its children
+'''
+def pss_kb(pid):
+    total = 0
+    pids = [pid] + [int(child) for child in open('/proc/%d/task/%d/children' % (pid, pid)).read().split()]
+    for process in pids:
+        with open('/proc/%d/smaps_rollup' % process) as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    total += int(line.split()[1])
+    return total
+
+
+def wait_until_up(port, timeout=30):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/healthz')
+            if connection.getresponse().status == 200:
+                return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('the server didn\'t start')
+
+
+def load(port, headers, clients, requests):
+    def client(count):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            connection.request('GET', '/movies', headers=headers)
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 200, response.status
+            samples.append(time.perf_counter() - start)
+        connection.close()
+        return samples
+
+    counts = [requests // clients + (i < requests % clients) for i in range(clients)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        samples = [sample for samples in pool.map(client, counts) for sample in samples]
+    return samples, time.perf_counter() - start
+
+
+def main(workers=2, clients=16, requests=2000):
+    directory = tempfile.mkdtemp()
+    database_path = os.environ.get('BENCH_DATABASE_URL')
+    if database_path is None:
+        database_path = 'sqlite:///' + os.path.join(directory, 'bench.db')
+    app = create_app({
+        'AUTH0_DOMAIN': BENCH_DOMAIN,
+        'API_AUDIENCE': BENCH_AUDIENCE,
+        'DATABASE_URL': database_path
+    })
+    with app.app_context():
+        create_schema()
+        db.session.query(Movie).delete()
+        db.session.execute(Movie.__table__.insert(), [
+            {'title': 'Movie %d' % i, 'release_date': date(2000, 1, 1)} for i in range(100)])
+        db.session.commit()
+
+    pem, jwks = generate_signing_key('bench-key')
+    server = serve_jwks(jwks)
+    token = sign_token(pem, 'bench-key', BENCH_DOMAIN, BENCH_AUDIENCE, ['get:movies'])
+    headers = {'Authorization': 'Bearer ' + token}
+
+    results = []
+    for mode, module in MODES:
+        if module is not None and importlib.util.find_spec(module) is None:
+            print('{:<9} skipped, {} is not installed'.format(mode, module))
+            continue
+        for preload in ('false', 'true'):
+            port = free_port()
+            env = dict(os.environ,
+                       AUTH0_DOMAIN=BENCH_DOMAIN,
+                       API_AUDIENCE=BENCH_AUDIENCE,
+                       DATABASE_URL=database_path,
+                       JWKS_URL='http://127.0.0.1:%d/.well-known/jwks.json' % server.server_port,
+                       RESPONSE_CACHE_SIZE='0',
+                       GUNICORN_WORKER_CLASS=mode,
+                       GUNICORN_PRELOAD=preload,
+                       WEB_CONCURRENCY=str(workers),
+                       PORT=str(port))
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--log-level', 'warning'],
+                env=env)
+            try:
+                boot = wait_until_up(port)
+                samples, elapsed = load(port, headers, clients, requests)
+                result = {
+                    'mode': mode,
+                    'preload': preload == 'true',
+                    'boot_ms': boot * 1000,
+                    'requests_per_sec': len(samples) / elapsed,
+                    'p50_ms': percentile(samples, 50) * 1000,
+                    'p99_ms': percentile(samples, 99) * 1000,
+                    'pss_mb': pss_kb(process.pid) / 1024
+                }
+            finally:
+                process.send_signal(signal.SIGTERM)
+                process.wait()
+            results.append(result)
+            print('{mode:<9} preload {preload!s:<5} boot {boot_ms:>7.0f}ms {requests_per_sec:>9.1f} req/s '
+                  'p50 {p50_ms:>7.2f}ms p99 {p99_ms:>7.2f}ms pss {pss_mb:>7.1f}MB'.format(**result))
+
+    server.shutdown()
+    print('(%d workers, %d clients)' % (workers, clients))
+    return results
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,85 @@
+'''
+Benchmark of the single item PATCH and DELETE write path.
+    select then write: Model.query.filter(...).one_or_none(), then mutate
+                       the instance and commit, the way the handlers used to
+    returning:         update_rows/delete_rows, one UPDATE/DELETE ... RETURNING
+Reports the latency and the number of SQL statements per operation.
+
+PostgreSQL is needed to measure the RETURNING path, SQLite falls back to a
+statement per step. Point BENCH_DATABASE_URL at a throwaway database and
+run it from the project directory:
+    python -m benchmarks.write_path [operations]
+'''
+import os
+import sys
+import tempfile
+from datetime import date
+
+from flask import Flask
+from sqlalchemy import event
+
+from models import setup_db, create_schema, db, Movie, update_rows, delete_rows
+from benchmarks.common import timeit, summarize, print_summary
+
+
+def seed(count):
+    db.session.query(Movie).delete()
+    db.session.execute(Movie.__table__.insert(), [
+        {'title': 'Movie %d' % i, 'release_date': date(2000, 1, 1)} for i in range(count)
+    ])
+    db.session.commit()
+    return [row[0] for row in db.session.query(Movie.id).order_by(Movie.id)]
+
+
+def main(operations=2000):
+    app = Flask(__name__)
+    database_path = os.environ.get('BENCH_DATABASE_URL')
+    if database_path is None:
+        database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    setup_db(app, database_path)
+    create_schema()
+
+    statements = []
+    results = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(1))
+
+        def run(name, fn, ids):
+            ids = iter(ids)
+            statements.clear()
+            result = summarize(name, timeit(lambda: fn(next(ids)), operations))
+            result['statements_per_op'] = len(statements) / operations
+            db.session.remove()
+            results.append(result)
+
+        def patch_select_then_write(id):
+            movie = Movie.query.filter(Movie.id == id).one_or_none()
+            movie.title = 'Patched'
+            movie.update()
+            movie.format()
+
+        def patch_returning(id):
+            Movie.format_row(update_rows(Movie, [id], {'title': 'Patched'})[0])
+
+        def delete_select_then_write(id):
+            movie = Movie.query.filter(Movie.id == id).one_or_none()
+            movie.delete()
+
+        def delete_returning(id):
+            delete_rows(Movie, [id])
+
+        ids = seed(operations * 2)
+        run('patch select then write', patch_select_then_write, ids[:operations])
+        run('patch returning', patch_returning, ids[operations:])
+        run('delete select then write', delete_select_then_write, ids[:operations])
+        run('delete returning', delete_returning, ids[operations:])
+
+    for result in results:
+        print_summary(result)
+        print('    %.1f statements per operation' % result['statements_per_op'])
+    return results
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,200 @@
+import os
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict
+from datetime import timezone
+from flask import request, Response
+from werkzeug.http import is_resource_modified
+
+from models import db, table_versions, read_revisions
+
+
+# Maximum number of responses kept by the response cache, 0 disables it
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+# Maximum total size in bytes of the cached response bodies
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Seconds a cached response is served, bounding how long writes committed by
+# other processes take to show, 0 keeps responses until a local write
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 5))
+
+'''
+ResponseCache
+Bounded LRU of serialized responses
+    it holds at most maxsize entries and max_bytes of response bodies,
+        evicting the least recently used entries first
+    every entry records the versions of the tables it was read from (see
+        models.table_versions), and is dropped as soon as one of them
+        changes, or when it is older than ttl seconds
+    hits, misses and evictions are counted for stats()
+'''
+class ResponseCache:
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 ttl=RESPONSE_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] != versions or
+                                      (self.ttl and entry[1] + self.ttl <= self.clock())):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, versions, response):
+        size = len(response[0])
+        if self.maxsize <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (versions, self.clock(), response)
+            self.bytes += size
+            while len(self._entries) > self.maxsize or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= len(entry[2][0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.maxsize,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache()
+
+'''
+set_response_cache(cache)
+    replaces the response cache used by cached endpoints,
+    i.e. ResponseCache(maxsize=0) disables it
+'''
+def set_response_cache(cache):
+    global response_cache
+    response_cache = cache
+
+
+def as_utc(moment):
+    # SQLite returns naive UTC datetimes
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+'''
+validators(tables, row=None, id=None)
+    builds the strong ETag and the Last-Modified of a response
+    a list response is validated by the revisions of tables, read without
+        touching their rows (see models.read_revisions)
+    the response of the row of model row with id is validated by its
+        updated_at column
+returns the ETag and the Last-Modified, or None twice if the row doesn't
+    exist
+'''
+def validators(tables, row=None, id=None):
+    if row is None:
+        revisions = read_revisions(tables)
+        etag = '-'.join('%s.%d' % (table, revision)
+                        for table, (revision, _) in zip(tables, revisions))
+        return etag, max(as_utc(modified_at) for _, modified_at in revisions)
+
+    updated_at = db.session.query(row.updated_at).filter(row.id == id).scalar()
+    if updated_at is None:
+        return None, None
+    updated_at = as_utc(updated_at)
+    return '%s.%d.%s' % (row.__tablename__, id, updated_at.strftime('%Y%m%d%H%M%S%f')), updated_at
+
+
+'''
+cached(*tables, row=None)
+    caches the 200 responses of a GET endpoint decorated by requires_auth in
+    the response cache, until a commit writes to one of tables
+    hits are served without touching the database, the ETag and
+        Last-Modified included, and commits of other processes only show
+        once the entries are ttl seconds old
+    the key is the path, the query arguments and the permissions of the
+        token, so roles never share entries
+    streamed responses aren't cached
+    responses carry the ETag and Last-Modified of validators(), of the row
+        of model row with the id of the route if row is given, and requests
+        whose If-None-Match or If-Modified-Since still match get a 304
+        without running the endpoint
+'''
+def cached(*tables, row=None):
+    def cached_decorator(f):
+        @wraps(f)
+        def wrapper(payload, *args, **kwargs):
+            key = (request.path,
+                   tuple(sorted(request.args.items(multi=True))),
+                   tuple(sorted(payload.get('permissions', []))))
+            versions = tuple(table_versions[table] for table in tables)
+            hit = response_cache.get(key, versions)
+            if hit is not None:
+                etag, last_modified = hit[3:]
+            else:
+                etag, last_modified = validators(tables, row, *kwargs.values())
+
+            if etag is not None and not is_resource_modified(
+                    request.environ, etag=etag, last_modified=last_modified):
+                response = Response(status=304)
+            elif hit is not None:
+                body, status, mimetype = hit[:3]
+                response = Response(body, status, mimetype=mimetype, headers={'X-Cache': 'HIT'})
+            else:
+                response = f(payload, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                if not response.is_streamed:
+                    response_cache.set(key, versions, (
+                        response.get_data(), response.status_code, response.mimetype,
+                        etag, last_modified))
+                    response.headers['X-Cache'] = 'MISS'
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+
+        return wrapper
+    return cached_decorator
+
+
+'''
+cache_stats()
+    returns the size, hit rate and eviction counts of the response cache
+'''
+def cache_stats():
+    return response_cache.stats()
@@ -0,0 +1,69 @@
+'''
+gunicorn settings of the casting agency, loaded by `gunicorn` from the
+project directory and by `python manage.py serve`
+    GUNICORN_WORKER_CLASS: sync, threaded or gevent (default: sync)
+    WEB_CONCURRENCY:       number of worker processes (default: from the
+                           cores, see default_workers)
+    GUNICORN_THREADS:      threads of every threaded worker (default: 4)
+    GUNICORN_PRELOAD:      load the app once in the master before forking
+                           the workers, so they share its memory
+                           copy-on-write (default: true, false for gevent)
+    PORT:                  port to listen on (default: 8080)
+'''
+import os
+import multiprocessing
+
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'threaded': 'gthread',
+    # pip install gevent psycogreen
+    'gevent': 'gevent'
+}
+
+worker_mode = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+if worker_mode not in WORKER_CLASSES:
+    raise ValueError('GUNICORN_WORKER_CLASS must be one of ' + ', '.join(WORKER_CLASSES))
+
+
+'''
+default_workers(mode, cores=None)
+    returns the number of workers for the cores of the machine: sync
+    workers wait on the database one request at a time, so there are
+    2 per core plus one, the others serve many requests each, so one
+    per core is enough to keep the cores busy
+'''
+def default_workers(mode, cores=None):
+    cores = cores or multiprocessing.cpu_count()
+    return cores * 2 + 1 if mode == 'sync' else cores
+
+
+worker_class = WORKER_CLASSES[worker_mode]
+workers = int(os.environ.get('WEB_CONCURRENCY') or default_workers(worker_mode))
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) if worker_mode == 'threaded' else 1
+bind = '0.0.0.0:' + os.environ.get('PORT', '8080')
+# gevent has to patch the standard library before the app imports it
+preload_app = os.environ.get(
+    'GUNICORN_PRELOAD', 'false' if worker_mode == 'gevent' else 'true').lower() in ('1', 'true', 'yes')
+
+# A preloaded app must not warm up in the master, post_worker_init warms
+# every worker up instead
+warm_up = os.environ.get('WARM_UP', '').lower() in ('1', 'true', 'yes')
+factory_args = "{'WARM_UP': False}" if preload_app else ''
+wsgi_app = 'app:create_app(%s)' % factory_args
+
+
+def post_fork(server, worker):
+    # Connections opened before the fork would be shared with the master
+    # and the other workers
+    from models import dispose_engines
+    dispose_engines()
+    if worker_mode == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    if preload_app and warm_up:
+        from app import start_warm_up
+        start_warm_up(worker.wsgi)
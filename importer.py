@@ -0,0 +1,178 @@
+import os
+import io
+import csv
+import sys
+import json
+import time
+
+from app import parse_movie, parse_actor
+from models import db, Movie, Actor, bump_version
+
+
+# Validation of the records and the columns they are copied to, per table
+TABLES = {
+    'movies': (Movie, parse_movie, ('title', 'release_date')),
+    'actors': (Actor, parse_actor, ('name', 'age', 'gender'))
+}
+
+# CSV values are all strings, these columns are converted to integers
+# before validation
+CSV_INTEGER_COLUMNS = {
+    'actors': ('age',)
+}
+
+
+def csv_integers(record, columns):
+    for column in columns:
+        value = record.get(column)
+        if value is not None and value.strip().lstrip('-').isdigit():
+            record[column] = int(value)
+    return record
+
+
+'''
+read_records(path, fmt)
+    streams the records of a CSV file with a header row, or of a newline
+    delimited JSON file, one dict at a time so memory stays constant
+'''
+def read_records(path, fmt):
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            for record in csv.DictReader(f):
+                yield record
+        else:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Reported as an invalid record by the caller
+                    yield None
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    raise ValueError('unknown file format, pass --format csv or --format ndjson')
+
+
+'''
+copy_rows(table, columns, rows)
+    writes a chunk of validated rows and commits it
+    on PostgreSQL the chunk is loaded with COPY ... FROM STDIN, other
+    databases fall back to a single executemany INSERT
+    csv.writer leaves empty strings unquoted, which COPY reads as NULL,
+    so the text columns are FORCE_NOT_NULL to keep a '' title or name
+    COPY bypasses the session, so the table version is bumped here
+'''
+def copy_rows(table, columns, rows):
+    if db.engine.dialect.name != 'postgresql':
+        db.session.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+        db.session.commit()
+        return
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    options = 'FORMAT csv'
+    text_columns = [column for column in columns
+                    if table.c[column].type.python_type is str]
+    if text_columns:
+        options += ', FORCE_NOT_NULL (%s)' % ', '.join(text_columns)
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.copy_expert(
+            'COPY %s (%s) FROM STDIN WITH (%s)' % (table.name, ', '.join(columns), options),
+            buffer)
+        connection.commit()
+        bump_version(table.name)
+    except:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, count):
+    with open(path, 'w') as f:
+        f.write(str(count))
+
+
+'''
+import_file(table, path, fmt=None, chunk_size=10000, resume=False, out=sys.stdout)
+    loads the movies or actors of a CSV or NDJSON file
+    every record goes through the same validation as POST /movies and
+        POST /actors, invalid records are reported and skipped
+    valid records are loaded chunk_size at a time, and the number of
+        records read up to the last committed chunk is kept in
+        <path>.progress, so resume=True continues after a failed chunk
+returns the number of rows loaded and the number of invalid records
+'''
+def import_file(table, path, fmt=None, chunk_size=10000, resume=False, out=sys.stdout):
+    model, parse, columns = TABLES[table]
+    fmt = fmt or detect_format(path)
+    checkpoint = path + '.progress'
+    skip = read_checkpoint(checkpoint) if resume else 0
+    if skip:
+        out.write('resuming after record %d\n' % skip)
+
+    loaded = 0
+    invalid = 0
+    read = 0
+    chunk = []
+    start = time.perf_counter()
+
+    def flush():
+        nonlocal loaded, chunk
+        try:
+            copy_rows(model.__table__, columns, chunk)
+        except Exception as e:
+            out.write('chunk ending at record %d failed: %s\n' % (read, e))
+            out.write('fix the file and rerun with --resume to continue after record %d\n'
+                      % read_checkpoint(checkpoint))
+            raise
+        loaded += len(chunk)
+        chunk = []
+        write_checkpoint(checkpoint, read)
+        elapsed = time.perf_counter() - start
+        out.write('%d rows loaded, %d invalid, %.0f rows/sec\n'
+                  % (loaded, invalid, loaded / elapsed if elapsed else 0))
+
+    if not resume:
+        write_checkpoint(checkpoint, 0)
+    for record in read_records(path, fmt):
+        read += 1
+        if read <= skip:
+            continue
+        if fmt == 'csv':
+            record = csv_integers(record, CSV_INTEGER_COLUMNS.get(table, ()))
+        try:
+            values = parse(record)
+        except ValueError as e:
+            invalid += 1
+            out.write('record %d is invalid: %s\n' % (read, e))
+            continue
+        chunk.append(tuple(values[column] for column in columns))
+        if len(chunk) == chunk_size:
+            flush()
+
+    if chunk:
+        flush()
+    os.remove(checkpoint)
+    return loaded, invalid
@@ -1,14 +1,94 @@
-from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
+import os
+import sys
+from flask_script import Manager, Command, Option
+from flask_migrate import Migrate, MigrateCommand, stamp
+from sqlalchemy import inspect
 
-from app import app
-from models import db
+from app import create_app
+from models import db, create_schema
 
+# The commands must not warm up, their database may not be migrated yet
+app = create_app({'WARM_UP': False})
 migrate = Migrate(app, db)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
 
+class ImportCommand(Command):
+    """Imports movies or actors from a CSV or NDJSON file"""
+
+    option_list = (
+        Option('table', choices=('movies', 'actors'),
+               help='Table to load the records into'),
+        Option('path', help='CSV file with a header row, or NDJSON file'),
+        Option('-f', '--format', dest='fmt', choices=('csv', 'ndjson'), default=None,
+               help='File format, detected from the extension by default'),
+        Option('-c', '--chunk-size', dest='chunk_size', type=int, default=10000,
+               help='Number of rows loaded per COPY'),
+        Option('--resume', action='store_true', default=False,
+               help='Continue after the last chunk loaded by a failed import'),
+    )
+
+    def run(self, table, path, fmt, chunk_size, resume):
+        from importer import import_file
+        loaded, invalid = import_file(table, path, fmt, chunk_size, resume)
+        print('done: %d rows loaded, %d invalid records skipped' % (loaded, invalid))
+
+
+manager.add_command('import', ImportCommand())
+
+
+class CreateDbCommand(Command):
+    """Creates the missing tables, indexes and triggers of the schema"""
+
+    def run(self):
+        fresh = not inspect(db.engine).get_table_names()
+        create_schema()
+        if fresh:
+            # The schema is already the latest one, later upgrades start from it
+            stamp()
+        print('done: schema created')
+
+
+manager.add_command('create_db', CreateDbCommand())
+
+
+class ServeCommand(Command):
+    """Serves the app with gunicorn and the settings of gunicorn.conf.py"""
+
+    option_list = (
+        Option('-k', '--worker-class', dest='worker_class',
+               choices=('sync', 'threaded', 'gevent'), default=None,
+               help='Worker model, sync by default'),
+        Option('-w', '--workers', dest='workers', type=int, default=None,
+               help='Number of worker processes, derived from the cores by default'),
+        Option('--threads', dest='threads', type=int, default=None,
+               help='Threads of every threaded worker'),
+        Option('--preload', dest='preload', choices=('true', 'false'), default=None,
+               help='Load the app in the master before forking the workers'),
+        Option('-p', '--port', dest='port', type=int, default=None,
+               help='Port to listen on, 8080 by default'),
+    )
+
+    def run(self, worker_class, workers, threads, preload, port):
+        settings = {
+            'GUNICORN_WORKER_CLASS': worker_class,
+            'WEB_CONCURRENCY': workers,
+            'GUNICORN_THREADS': threads,
+            'GUNICORN_PRELOAD': preload,
+            'PORT': port
+        }
+        os.environ.update((name, str(value)) for name, value in settings.items()
+                          if value is not None)
+        directory = os.path.dirname(os.path.abspath(__file__))
+        # Replace this process, the app it loaded isn't the one served
+        os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '--chdir', directory,
+                                   '--config', os.path.join(directory, 'gunicorn.conf.py')])
+
+
+manager.add_command('serve', ServeCommand())
+
+
 if __name__ == '__main__':
-    manager.run()
\ No newline at end of file
+    manager.run()
@@ -0,0 +1,45 @@
+"""add indexes backing the filters and sorts of the list endpoints
+
+Revision ID: 5d2c4b7e9a10
+Revises: 
+Create Date: 2026-10-16 10:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2c4b7e9a10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_movies_release_date_id', 'movies', ['release_date', 'id'], {}),
+    ('ix_movies_title_id', 'movies', ['title', 'id'], {}),
+    ('ix_movies_title_pattern', 'movies', ['title'],
+     {'postgresql_ops': {'title': 'text_pattern_ops'}}),
+    ('ix_actors_age_id', 'actors', ['age', 'id'], {}),
+    ('ix_actors_gender_age_id', 'actors', ['gender', 'age', 'id'], {}),
+    ('ix_actors_name_id', 'actors', ['name', 'id'], {}),
+]
+
+
+def existing_indexes(table):
+    # Databases created by db.create_all() already have the indexes
+    inspector = sa.inspect(op.get_bind())
+    return set(index['name'] for index in inspector.get_indexes(table))
+
+
+def upgrade():
+    for name, table, columns, options in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns, **options)
+
+
+def downgrade():
+    for name, table, columns, options in reversed(INDEXES):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,44 @@
+"""add the trigram indexes backing the search endpoints
+
+Revision ID: 8b1f3e6c2d47
+Revises: 5d2c4b7e9a10
+Create Date: 2026-10-16 14:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1f3e6c2d47'
+down_revision = '5d2c4b7e9a10'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_movies_title_trgm', 'movies', 'title'),
+    ('ix_actors_name_trgm', 'actors', 'name'),
+]
+
+
+def existing_indexes(table):
+    # Databases created by db.create_all() already have the indexes
+    inspector = sa.inspect(op.get_bind())
+    return set(index['name'] for index in inspector.get_indexes(table))
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, [column], postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    # pg_trgm is left installed, other objects of the database may use it
+    for name, table, column in reversed(INDEXES):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
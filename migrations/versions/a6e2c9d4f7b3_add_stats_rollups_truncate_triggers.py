@@ -0,0 +1,81 @@
+"""empty the stats rollups of actors and movies when they are truncated
+
+Revision ID: a6e2c9d4f7b3
+Revises: f3d8a1b6c9e4
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e2c9d4f7b3'
+down_revision = 'f3d8a1b6c9e4'
+branch_labels = None
+depends_on = None
+
+
+ROLLUPS = {
+    'actors': (
+        ('actors_gender', 'CASE WHEN gender THEN 1 ELSE 0 END'),
+        ('actors_age', 'age / 10 * 10'),
+    ),
+    'movies': (
+        ('movies_year', 'CAST(EXTRACT(YEAR FROM release_date) AS INTEGER)'),
+    ),
+}
+
+
+def rollup_upsert(table, source, sign=''):
+    buckets = ' UNION ALL '.join(
+        "SELECT '%s' AS dimension, %s AS bucket FROM %s" % (dimension, bucket, source)
+        for dimension, bucket in ROLLUPS[table])
+    return ('INSERT INTO stats_rollups (dimension, bucket, count) '
+            'SELECT dimension, bucket, %scount(*) FROM (%s) AS buckets '
+            'GROUP BY dimension, bucket ORDER BY dimension, bucket '
+            'ON CONFLICT (dimension, bucket) DO UPDATE SET count = stats_rollups.count + excluded.count'
+            % (sign, buckets))
+
+
+def rollup_clear(table):
+    return ('UPDATE stats_rollups SET count = 0 WHERE dimension IN (%s)'
+            % ', '.join("'%s'" % dimension for dimension, _ in ROLLUPS[table]))
+
+
+def rollup_function(table, truncate):
+    return """CREATE OR REPLACE FUNCTION %(table)s_stats_rollup() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    %(remove)s;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'INSERT') THEN
+    %(add)s;
+  END IF;%(truncate)s
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql""" % {
+        'table': table,
+        'remove': rollup_upsert(table, 'old_rows', '-'),
+        'add': rollup_upsert(table, 'new_rows'),
+        'truncate': "\n  IF TG_OP = 'TRUNCATE' THEN\n    %s;\n  END IF;" % rollup_clear(table)
+                    if truncate else ''
+    }
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ROLLUPS:
+        op.execute(rollup_function(table, truncate=True))
+        # Databases created by db.create_all() may already have the trigger
+        op.execute('DROP TRIGGER IF EXISTS %s_stats_truncate ON %s' % (table, table))
+        op.execute('CREATE TRIGGER %s_stats_truncate AFTER TRUNCATE ON %s '
+                   'FOR EACH STATEMENT EXECUTE PROCEDURE %s_stats_rollup()' % (table, table, table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ROLLUPS:
+        op.execute('DROP TRIGGER IF EXISTS %s_stats_truncate ON %s' % (table, table))
+        op.execute(rollup_function(table, truncate=False))
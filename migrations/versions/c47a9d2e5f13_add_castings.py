@@ -0,0 +1,41 @@
+"""add the castings of actors in movies
+
+Revision ID: c47a9d2e5f13
+Revises: 8b1f3e6c2d47
+Create Date: 2026-10-16 15:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a9d2e5f13'
+down_revision = '8b1f3e6c2d47'
+branch_labels = None
+depends_on = None
+
+
+def has_table(name):
+    # Databases created by db.create_all() already have the table
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if has_table('castings'):
+        return
+    op.create_table(
+        'castings',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['actor_id'], ['actors.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+    op.create_index('ix_castings_actor_id_movie_id', 'castings', ['actor_id', 'movie_id'])
+
+
+def downgrade():
+    if has_table('castings'):
+        op.drop_index('ix_castings_actor_id_movie_id', table_name='castings')
+        op.drop_table('castings')
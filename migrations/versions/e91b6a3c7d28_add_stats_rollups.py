@@ -0,0 +1,90 @@
+"""add the stats rollups maintained by triggers on actors and movies
+
+Revision ID: e91b6a3c7d28
+Revises: c47a9d2e5f13
+Create Date: 2026-10-16 16:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b6a3c7d28'
+down_revision = 'c47a9d2e5f13'
+branch_labels = None
+depends_on = None
+
+
+ROLLUPS = {
+    'actors': (
+        ('actors_gender', 'CASE WHEN gender THEN 1 ELSE 0 END'),
+        ('actors_age', 'age / 10 * 10'),
+    ),
+    'movies': (
+        ('movies_year', 'CAST(EXTRACT(YEAR FROM release_date) AS INTEGER)'),
+    ),
+}
+
+
+def rollup_upsert(table, source, sign=''):
+    buckets = ' UNION ALL '.join(
+        "SELECT '%s' AS dimension, %s AS bucket FROM %s" % (dimension, bucket, source)
+        for dimension, bucket in ROLLUPS[table])
+    return ('INSERT INTO stats_rollups (dimension, bucket, count) '
+            'SELECT dimension, bucket, %scount(*) FROM (%s) AS buckets '
+            'GROUP BY dimension, bucket ORDER BY dimension, bucket '
+            'ON CONFLICT (dimension, bucket) DO UPDATE SET count = stats_rollups.count + excluded.count'
+            % (sign, buckets))
+
+
+def upgrade():
+    # Databases created by db.create_all() already have the rollups
+    if sa.inspect(op.get_bind()).has_table('stats_rollups'):
+        return
+    op.create_table(
+        'stats_rollups',
+        sa.Column('dimension', sa.String(), nullable=False),
+        sa.Column('bucket', sa.Integer(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('dimension', 'bucket')
+    )
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ROLLUPS:
+        op.execute("""CREATE OR REPLACE FUNCTION %(table)s_stats_rollup() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    %(remove)s;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'INSERT') THEN
+    %(add)s;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql""" % {
+            'table': table,
+            'remove': rollup_upsert(table, 'old_rows', '-'),
+            'add': rollup_upsert(table, 'new_rows')
+        })
+        for event, transition in (('insert', 'NEW TABLE AS new_rows'),
+                                  ('update', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                                  ('delete', 'OLD TABLE AS old_rows')):
+            op.execute(
+                'CREATE TRIGGER %s_stats_%s AFTER %s ON %s REFERENCING %s '
+                'FOR EACH STATEMENT EXECUTE PROCEDURE %s_stats_rollup()'
+                % (table, event, event.upper(), table, transition, table))
+        # Count the rows the table already has, CREATE TRIGGER holds off writes
+        # to it until the migration commits
+        op.execute(rollup_upsert(table, table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in ROLLUPS:
+            for event in ('insert', 'update', 'delete'):
+                op.execute('DROP TRIGGER IF EXISTS %s_stats_%s ON %s' % (table, event, table))
+            op.execute('DROP FUNCTION IF EXISTS %s_stats_rollup()' % table)
+    if sa.inspect(op.get_bind()).has_table('stats_rollups'):
+        op.drop_table('stats_rollups')
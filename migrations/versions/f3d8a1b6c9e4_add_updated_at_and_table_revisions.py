@@ -0,0 +1,91 @@
+"""add updated_at to movies and actors, and the table revisions behind the ETags
+
+Revision ID: f3d8a1b6c9e4
+Revises: e91b6a3c7d28
+Create Date: 2026-10-16 18:30:00.000000
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3d8a1b6c9e4'
+down_revision = 'e91b6a3c7d28'
+branch_labels = None
+depends_on = None
+
+
+REVISIONED_TABLES = ('movies', 'actors', 'castings')
+
+
+def columns(table):
+    return set(column['name'] for column in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('movies', 'actors'):
+        if 'updated_at' in columns(table):
+            continue
+        # SQLite can only add a column with a non-constant default by
+        # recreating the table
+        with op.batch_alter_table(table, recreate='always' if dialect == 'sqlite' else 'auto') as batch:
+            batch.add_column(sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False,
+                                       server_default=sa.func.now()))
+
+    # Databases created by db.create_all() already have the revisions
+    if sa.inspect(op.get_bind()).has_table('table_revisions'):
+        return
+    table_revisions = op.create_table(
+        'table_revisions',
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('revision', sa.BigInteger(), nullable=False),
+        sa.Column('modified_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_revisions, [
+        {'table_name': table, 'revision': 1, 'modified_at': datetime.now(timezone.utc)}
+        for table in REVISIONED_TABLES
+    ])
+
+    if dialect == 'postgresql':
+        op.execute("""CREATE OR REPLACE FUNCTION bump_table_revision() RETURNS trigger AS $$
+BEGIN
+  UPDATE table_revisions SET revision = revision + 1, modified_at = clock_timestamp()
+  WHERE table_name = TG_TABLE_NAME;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql""")
+        for table in REVISIONED_TABLES:
+            op.execute(
+                'CREATE TRIGGER %s_revision AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %s '
+                'FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_revision()' % (table, table))
+    elif dialect == 'sqlite':
+        for table in REVISIONED_TABLES:
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                op.execute(
+                    "CREATE TRIGGER %s_revision_%s AFTER %s ON %s BEGIN "
+                    "UPDATE table_revisions SET revision = revision + 1, "
+                    "modified_at = strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now') "
+                    "WHERE table_name = '%s'; END" % (table, event.lower(), event, table, table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in REVISIONED_TABLES:
+            op.execute('DROP TRIGGER IF EXISTS %s_revision ON %s' % (table, table))
+        op.execute('DROP FUNCTION IF EXISTS bump_table_revision()')
+    elif dialect == 'sqlite':
+        for table in REVISIONED_TABLES:
+            for event in ('insert', 'update', 'delete'):
+                op.execute('DROP TRIGGER IF EXISTS %s_revision_%s' % (table, event))
+    if sa.inspect(op.get_bind()).has_table('table_revisions'):
+        op.drop_table('table_revisions')
+
+    for table in ('movies', 'actors'):
+        if 'updated_at' in columns(table):
+            with op.batch_alter_table(table) as batch:
+                batch.drop_column('updated_at')
@@ -1,38 +1,545 @@
 import os
-from sqlalchemy import Column, String, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import time
+import logging
+import itertools
+import functools
+import collections
+import threading
+import sqlite3
+from flask import request, has_request_context
+from sqlalchemy import (Column, String, Integer, DDL, create_engine, any_, bindparam, case, cast,
+                        exc, event, extract, func, text)
+from sqlalchemy.sql import Select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.engine import Engine
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
 import json
+from datetime import datetime, timezone
 
-database_path = os.environ['DATABASE_URL']
-# Fix for heroku 'postgresql' instead of 'postgres'
-if database_path[0:8] == 'postgres':
-  if database_path[8:10] != 'ql':
-    database_path = database_path[:8]+'ql' + database_path[8:]
 
-db = SQLAlchemy()
+def fix_database_url(url):
+  # Fix for heroku 'postgresql' instead of 'postgres'
+  if url[0:8] == 'postgres':
+    if url[8:10] != 'ql':
+      url = url[:8]+'ql' + url[8:]
+  return url
+
+
+'''
+replica_urls(urls)
+    parses the optional read replicas of DATABASE_URL, given as a comma
+    separated string or as a list of urls
+'''
+def replica_urls(urls):
+  if isinstance(urls, str):
+    urls = urls.split(',')
+  return [fix_database_url(url.strip()) for url in urls if url.strip()]
+
+# Checkouts waiting longer than this many milliseconds for a connection are logged
+DB_POOL_WAIT_WARNING = int(os.environ.get('DB_POOL_WAIT_WARNING', 100))
+# Seconds a replica that failed is skipped before it is checked again
+DB_REPLICA_RETRY_INTERVAL = int(os.environ.get('DB_REPLICA_RETRY_INTERVAL', 30))
+
+logger = logging.getLogger(__name__)
+
+
+'''
+get_replica_set(app=None)
+    returns the ReplicaSet setup_db bound to app, the current app by
+    default, or None if it has no read replicas
+'''
+def get_replica_set(app=None):
+  return (app or db.get_app()).extensions.get('replica_set')
+
+
+'''
+RoutingSession
+Session sending the reads of GET and HEAD requests to a read replica
+    writes, flushes and anything that isn't a SELECT go to the primary
+    once a session wrote, its reads go to the primary too, so a request
+        reads its own writes
+    a session keeps using the replica it picked first, and connects to it
+        up front so a dead replica fails over to the next one, or to the
+        primary, instead of failing the request
+'''
+class RoutingSession(SignallingSession):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._wrote = False
+    self._replica = None
+
+  def get_bind(self, mapper=None, clause=None, **kwargs):
+    if self._flushing or not isinstance(clause, Select):
+      self._wrote = True
+    replica_set = get_replica_set(self.app)
+    if (self._wrote or replica_set is None or not has_request_context()
+        or request.method not in ('GET', 'HEAD')):
+      return super().get_bind(mapper, clause)
+
+    if self._replica is None:
+      self._replica = self._connect_replica(replica_set)
+    return self._replica or super().get_bind(mapper, clause)
+
+  def _connect_replica(self, replica_set):
+    for _ in replica_set.engines:
+      replica = replica_set.choose()
+      if replica is None:
+        break
+      try:
+        self.connection(bind_arguments={'bind': replica})
+        return replica
+      except exc.DBAPIError:
+        # The handle_error listener of the replica set marked it down
+        continue
+    return False
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
 
 '''
-setup_db(app)
-    binds a flask application and a SQLAlchemy service
+Table versions
+in-process counters of the commits that wrote to each table, so data derived
+from a table (like the response cache) knows when it is stale
+    ORM flushes and INSERT/UPDATE/DELETE statements run through the session
+        are tracked, and counted once their transaction commits
+    writes bypassing the session have to call bump_version themselves
+    writes of other processes aren't counted, the response cache bounds
+        how long they take to show with its ttl
 '''
-def setup_db(app, database_path=database_path):
+table_versions = collections.Counter()
+_table_versions_lock = threading.Lock()
+
+
+def bump_version(*table_names):
+  with _table_versions_lock:
+    for name in table_names:
+      table_versions[name] += 1
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+  written = session.info.setdefault('written_tables', set())
+  for instance in itertools.chain(session.new, session.dirty, session.deleted):
+    written.add(instance.__table__.name)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _track_executed_tables(orm_execute_state):
+  if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+    written = orm_execute_state.session.info.setdefault('written_tables', set())
+    written.add(orm_execute_state.statement.table.name)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _bump_written_tables(session):
+  bump_version(*session.info.pop('written_tables', ()))
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_written_tables(session):
+  session.info.pop('written_tables', None)
+
+
+'''
+InstrumentedQueuePool
+QueuePool recording how long every checkout waits for a free connection
+and how many checkouts time out, so pools can be sized from real numbers
+'''
+class InstrumentedQueuePool(QueuePool):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._stats_lock = threading.Lock()
+    self.checkouts = 0
+    self.timeouts = 0
+    self.wait_total = 0.0
+    self.wait_max = 0.0
+
+  def _do_get(self):
+    start = time.perf_counter()
+    timed_out = False
+    try:
+      return super()._do_get()
+    except exc.TimeoutError:
+      timed_out = True
+      raise
+    finally:
+      wait = time.perf_counter() - start
+      with self._stats_lock:
+        self.checkouts += 1
+        self.timeouts += timed_out
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+      if wait * 1000 >= DB_POOL_WAIT_WARNING:
+        logger.warning('waited %.1fms for a database connection (%s)',
+                       wait * 1000, self.status())
+
+
+'''
+engine_options(database_path)
+    builds the SQLAlchemy engine options from the environment
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds),
+        DB_POOL_RECYCLE (seconds), DB_POOL_PRE_PING,
+        DB_STATEMENT_TIMEOUT (milliseconds) and DB_APPLICATION_NAME
+    pool options are only used by databases with a connection pool, and
+    the server-side options only by PostgreSQL
+'''
+def engine_options(database_path):
+  if database_path.startswith('sqlite'):
+    return {}
+
+  options = {
+    'poolclass': InstrumentedQueuePool,
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+  }
+
+  if database_path.startswith('postgresql'):
+    connect_args = {
+      'application_name': os.environ.get('DB_APPLICATION_NAME', 'casting-agency')
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout:
+      connect_args['options'] = '-c statement_timeout=%d' % statement_timeout
+    options['connect_args'] = connect_args
+
+  return options
+
+
+'''
+engine_pool_stats(engine)
+    reports the connection pool usage of an engine
+    saturation is the share of the pool, overflow included, checked out
+    wait_avg_ms and wait_max_ms are the time checkouts waited for a
+    free connection
+'''
+def engine_pool_stats(engine):
+  pool = engine.pool
+  if not isinstance(pool, InstrumentedQueuePool):
+    return {'pool': type(pool).__name__}
+
+  capacity = pool.size() + pool._max_overflow
+  return {
+    'pool': type(pool).__name__,
+    'size': pool.size(),
+    'max_overflow': pool._max_overflow,
+    'checked_out': pool.checkedout(),
+    'overflow': max(pool.overflow(), 0),
+    'saturation': pool.checkedout() / capacity if capacity > 0 else 0,
+    'checkouts': pool.checkouts,
+    'timeouts': pool.timeouts,
+    'wait_avg_ms': pool.wait_total / pool.checkouts * 1000 if pool.checkouts else 0,
+    'wait_max_ms': pool.wait_max * 1000
+  }
+
+
+'''
+pool_stats()
+    reports the connection pool usage of the app's engine and of every
+    read replica, in the order of DATABASE_REPLICA_URLS
+'''
+def pool_stats():
+  replica_set = get_replica_set()
+  return {
+    'primary': engine_pool_stats(db.engine),
+    'replicas': [engine_pool_stats(engine) for engine in replica_set.engines]
+                if replica_set is not None else []
+  }
+
+
+'''
+warm_pool()
+    opens pool_size connections of the app's engine, and of every read
+    replica, at once so the first requests don't pay for the connection
+    setup
+returns the number of connections opened
+'''
+def warm_pool():
+  replica_set = get_replica_set()
+  engines = [db.engine] + (replica_set.engines if replica_set is not None else [])
+  opened = 0
+  for engine in engines:
+    count = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+    connections = [engine.connect() for _ in range(count)]
+    try:
+      for connection in connections:
+        connection.execute(text('SELECT 1'))
+    finally:
+      for connection in connections:
+        connection.close()
+    opened += count
+  return opened
+
+
+'''
+pool_ready()
+    tells if the app's engine can hand out a connection without waiting,
+    without touching the database
+'''
+def pool_ready():
+  pool = db.engine.pool
+  # A negative max_overflow doesn't limit the connections
+  if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+    return True
+  return pool.checkedout() < pool.size() + pool._max_overflow
+
+
+'''
+ReplicaSet
+Round-robin over the engines of the read replicas
+    a replica whose connection fails is skipped for retry_interval seconds,
+        then checked with a SELECT 1 in the background before it gets
+        traffic again
+    choose() returns None when no replica is healthy, so reads fall back
+        to the primary
+'''
+class ReplicaSet:
+  def __init__(self, urls, retry_interval=DB_REPLICA_RETRY_INTERVAL):
+    self.engines = [create_engine(url, **engine_options(url)) for url in urls]
+    self.retry_interval = retry_interval
+    self._down_until = {}
+    self._checking = set()
+    self._counter = itertools.count()
+    self._lock = threading.Lock()
+    for engine in self.engines:
+      event.listen(engine, 'handle_error', self._on_error)
+
+  def _on_error(self, context):
+    # Only connection failures take a replica out, not bad statements
+    if context.is_disconnect or context.connection is None:
+      self.mark_down(context.engine)
+
+  def mark_down(self, engine):
+    logger.warning('read replica %s is down, skipping it for %ds',
+                   repr(engine.url), self.retry_interval)
+    with self._lock:
+      self._down_until[engine] = time.monotonic() + self.retry_interval
+
+  def _check_in_background(self, engine):
+    with self._lock:
+      if engine in self._checking:
+        return
+      self._checking.add(engine)
+
+    def run():
+      try:
+        with engine.connect() as connection:
+          connection.execute(text('SELECT 1'))
+        with self._lock:
+          self._down_until.pop(engine, None)
+      except Exception:
+        self.mark_down(engine)
+      finally:
+        with self._lock:
+          self._checking.discard(engine)
+
+    threading.Thread(target=run, daemon=True).start()
+
+  def choose(self):
+    now = time.monotonic()
+    start = next(self._counter)
+    for offset in range(len(self.engines)):
+      engine = self.engines[(start + offset) % len(self.engines)]
+      down_until = self._down_until.get(engine)
+      if down_until is None:
+        return engine
+      if down_until <= now:
+        self._check_in_background(engine)
+    return None
+
+  def dispose(self):
+    for engine in self.engines:
+      engine.dispose()
+
+
+'''
+setup_db(app, database_path=None, replica_paths=None)
+    binds a flask application and a SQLAlchemy service, to the DATABASE_URL
+    and DATABASE_REPLICA_URLS environment variables when not given
+    the engine and its connection pool are tuned by engine_options, and
+    nothing connects to the database until the first query
+    the reads of GET and HEAD requests are routed to the replicas, if any,
+    kept per app in app.extensions['replica_set']
+    the schema isn't created here, see create_schema
+'''
+def setup_db(app, database_path=None, replica_paths=None):
+    database_path = fix_database_url(database_path or os.environ['DATABASE_URL'])
+    if replica_paths is None:
+      replica_paths = os.environ.get('DATABASE_REPLICA_URLS', '')
+    replica_paths = replica_urls(replica_paths)
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
+
+    previous = app.extensions.get('replica_set')
+    if previous is not None:
+      previous.dispose()
+    app.extensions['replica_set'] = ReplicaSet(replica_paths) if replica_paths else None
+
+
+'''
+dispose_engines()
+    drops the pooled connections of the app's engine and of the read
+    replicas, which a worker forked from a process that had the app
+    loaded (gunicorn --preload) would otherwise share with its siblings
+    the next queries open the worker's own connections
+'''
+def dispose_engines():
+    if db.app is None:
+      return
+    db.get_engine(db.app).dispose()
+    replica_set = get_replica_set(db.app)
+    if replica_set is not None:
+      replica_set.dispose()
+
+
+'''
+create_schema()
+    creates the tables, indexes and triggers missing from the database of
+    the app bound by setup_db, an explicit deployment step
+    (python manage.py create_db) rather than something every worker does
+    when it boots
+'''
+def create_schema():
     db.create_all()
 
 
+'''
+id_in(model, ids)
+    filters model by a list of ids, as a single id = ANY(:ids) array
+    parameter on PostgreSQL and as id IN (...) elsewhere
+'''
+def id_in(model, ids):
+  return column_in(model.id, ids)
+
+
+def column_in(column, ids):
+  if db.engine.dialect.name == 'postgresql':
+    return column == any_(bindparam('ids', list(ids), type_=ARRAY(Integer)))
+  return column.in_(list(ids))
+
+
+'''
+update_rows(model, ids, values)
+    sets values on the rows of model whose id is in ids and commits
+    it runs a single UPDATE ... WHERE id = ANY(...) RETURNING statement
+    where the database supports it
+returns the updated rows as tuples of model.read_columns()
+'''
+def update_rows(model, ids, values):
+  table = model.__table__
+  statement = table.update().where(id_in(model, ids)).values(**values)
+  try:
+    if getattr(db.engine.dialect, 'full_returning', False):
+      rows = db.session.execute(statement.returning(*model.read_columns())).fetchall()
+    else:
+      db.session.execute(statement)
+      rows = db.session.query(*model.read_columns()).filter(id_in(model, ids)).all()
+    db.session.commit()
+  except:
+    db.session.rollback()
+    raise
+  return rows
+
+
+'''
+delete_rows(model, ids)
+    deletes the rows of model whose id is in ids and commits
+    it runs a single DELETE ... WHERE id = ANY(...) RETURNING id statement
+    where the database supports it
+returns the ids of the deleted rows
+'''
+def delete_rows(model, ids):
+  table = model.__table__
+  statement = table.delete().where(id_in(model, ids))
+  try:
+    if getattr(db.engine.dialect, 'full_returning', False):
+      deleted = [row[0] for row in db.session.execute(statement.returning(model.id))]
+    else:
+      deleted = [row[0] for row in db.session.query(model.id).filter(id_in(model, ids))]
+      db.session.execute(statement)
+    db.session.commit()
+  except:
+    db.session.rollback()
+    raise
+  return deleted
+
+
+def utcnow():
+  return datetime.now(timezone.utc)
+
+
+MONTHS = ('January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December')
+
+
+'''
+format_date(value)
+    formats a date like "March 04, 2022", the format of the API, with
+    English month names whatever the locale, unlike strftime('%B')
+    release dates repeat a lot, so the strings are cached
+'''
+@functools.lru_cache(maxsize=65536)
+def format_date(value):
+  # strftime doesn't pad the year either, year 999 is 'March 04, 999'
+  return '%s %02d, %d' % (MONTHS[value.month - 1], value.day, value.year)
+
+
+'''
+Castings
+Actors assigned to movies
+    the rows of a movie or an actor are deleted with it
+'''
+castings = db.Table(
+  'castings',
+  Column('movie_id', db.Integer, db.ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True),
+  Column('actor_id', db.Integer, db.ForeignKey('actors.id', ondelete='CASCADE'), primary_key=True),
+  # The primary key serves the casts of movies, this serves the filmographies of actors
+  db.Index('ix_castings_actor_id_movie_id', 'actor_id', 'movie_id'),
+)
+
+# INSERT constructs supporting ON CONFLICT DO NOTHING, per dialect
+ON_CONFLICT_INSERTS = {
+  'postgresql': postgresql.insert,
+  'sqlite': sqlite.insert
+}
+
+
 '''
 Movies
 Have title and release date
 '''
 class Movie(db.Model):  
   __tablename__ = 'movies'
+  # Indexes backing the filters and sorts of GET /movies
+  __table_args__ = (
+    db.Index('ix_movies_release_date_id', 'release_date', 'id'),
+    db.Index('ix_movies_title_id', 'title', 'id'),
+    db.Index('ix_movies_title_pattern', 'title', postgresql_ops={'title': 'text_pattern_ops'}),
+    # Trigram index backing GET /movies/search
+    db.Index('ix_movies_title_trgm', 'title',
+             postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+  )
 
   id = Column(db.Integer, primary_key=True)
   title = Column(db.String(), nullable=False)
   release_date = Column(db.Date, nullable=False)
+  # Last-Modified of GET /movies/<id>, rows loaded with COPY get the server default
+  updated_at = Column(db.DateTime(timezone=True), nullable=False,
+                      default=utcnow, onupdate=utcnow, server_default=func.now())
 
   def __init__(self, title, release_date):
     self.title = title
@@ -50,10 +557,24 @@ class Movie(db.Model):
     db.session.commit()
 
   def format(self):
+    return Movie.format_row((self.id, self.title, self.release_date))
+
+  '''
+  read_columns()
+      the only columns the list endpoints select, in format_row order,
+      so they can read plain tuples instead of building Movie instances
+  '''
+  @classmethod
+  def read_columns(cls):
+    return (cls.id, cls.title, cls.release_date)
+
+  @staticmethod
+  def format_row(row):
+    id, title, release_date = row
     return {
-      'id': self.id,
-      'title': self.title,
-      'release_date': self.release_date.strftime('%B %d, %Y')
+      'id': id,
+      'title': title,
+      'release_date': format_date(release_date)
     }
 
 
@@ -63,11 +584,23 @@ Have name, age and gender
 '''
 class Actor(db.Model):  
   __tablename__ = 'actors'
+  # Indexes backing the filters and sorts of GET /actors
+  __table_args__ = (
+    db.Index('ix_actors_age_id', 'age', 'id'),
+    db.Index('ix_actors_gender_age_id', 'gender', 'age', 'id'),
+    db.Index('ix_actors_name_id', 'name', 'id'),
+    # Trigram index backing GET /actors/search
+    db.Index('ix_actors_name_trgm', 'name',
+             postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+  )
 
   id = Column(db.Integer, primary_key=True)
   name = Column(db.String(), nullable=False)
   age = Column(db.Integer, nullable=False)
   gender = Column(db.Boolean, nullable=False)
+  # Last-Modified of GET /actors/<id>, rows loaded with COPY get the server default
+  updated_at = Column(db.DateTime(timezone=True), nullable=False,
+                      default=utcnow, onupdate=utcnow, server_default=func.now())
 
   def __init__(self, name, age, gender):
     self.name = name
@@ -86,9 +619,307 @@ class Actor(db.Model):
     db.session.commit()
 
   def format(self):
+    return Actor.format_row((self.id, self.name, self.age, self.gender))
+
+  '''
+  read_columns()
+      the only columns the list endpoints select, in format_row order,
+      so they can read plain tuples instead of building Actor instances
+  '''
+  @classmethod
+  def read_columns(cls):
+    return (cls.id, cls.name, cls.age, cls.gender)
+
+  @staticmethod
+  def format_row(row):
+    id, name, age, gender = row
     return {
-      'id': self.id,
-      'name': self.name,
-      'age': self.age,
-      'gender': 'male' if self.gender else 'female'
-    }
\ No newline at end of file
+      'id': id,
+      'name': name,
+      'age': age,
+      'gender': 'male' if gender else 'female'
+    }
+
+
+'''
+related_rows(model, ids)
+    loads the actors cast in the movies of ids, or the movies the actors of
+    ids are cast in, with a single query whatever the number of ids, the
+    way selectinload batches a relationship, so listing N movies with their
+    casts never costs N+1 queries
+returns a dict of the rows of the other model, as tuples of its
+    read_columns() ordered by id, by id of model
+'''
+def related_rows(model, ids):
+  if model is Movie:
+    key, other, other_key = castings.c.movie_id, Actor, castings.c.actor_id
+  else:
+    key, other, other_key = castings.c.actor_id, Movie, castings.c.movie_id
+
+  related = collections.defaultdict(list)
+  if not ids:
+    return related
+  query = (db.session.query(key, *other.read_columns())
+           .join(castings, other_key == other.id)
+           .filter(column_in(key, ids))
+           .order_by(key, other.id))
+  for row in query:
+    related[row[0]].append(tuple(row[1:]))
+  return related
+
+
+'''
+assign_actor(movie_id, actor_id)
+    casts the actor in the movie and commits, doing nothing if it already is
+    the casting is inserted with ON CONFLICT DO NOTHING where the database
+    supports it, so concurrent identical assignments all succeed
+returns False if the movie or the actor doesn't exist
+'''
+def assign_actor(movie_id, actor_id):
+  if (db.session.query(Movie.id).filter(Movie.id == movie_id).scalar() is None
+      or db.session.query(Actor.id).filter(Actor.id == actor_id).scalar() is None):
+    return False
+
+  dialect = db.engine.dialect.name
+  values = {'movie_id': movie_id, 'actor_id': actor_id}
+  try:
+    if dialect in ON_CONFLICT_INSERTS:
+      db.session.execute(
+        ON_CONFLICT_INSERTS[dialect](castings).values(**values).on_conflict_do_nothing())
+    else:
+      db.session.execute(castings.insert().values(**values))
+    db.session.commit()
+  except exc.IntegrityError:
+    db.session.rollback()
+    # Another request cast the actor first
+    if db.session.query(castings).filter_by(**values).first() is None:
+      raise
+  except:
+    db.session.rollback()
+    raise
+  return True
+
+
+'''
+unassign_actor(movie_id, actor_id)
+    removes the actor from the cast of the movie and commits
+returns False if the actor wasn't cast in the movie
+'''
+def unassign_actor(movie_id, actor_id):
+  statement = castings.delete().where(
+    (castings.c.movie_id == movie_id) & (castings.c.actor_id == actor_id))
+  try:
+    deleted = db.session.execute(statement).rowcount
+    db.session.commit()
+  except:
+    db.session.rollback()
+    raise
+  return deleted > 0
+
+
+'''
+Stats rollups
+Counts of actors by gender and by age bucket, and of movies by release year,
+behind GET /stats
+    on PostgreSQL, statement level triggers on actors and movies fold the
+        GROUP BY of the rows every INSERT, UPDATE, DELETE or COPY touched
+        into stats_rollups, so reading the stats never scans the tables,
+        and a TRUNCATE empties the buckets of its table
+    other databases compute the same GROUP BY from the tables on every read
+    buckets whose rows were all deleted are kept with a count of 0
+'''
+stats_rollups = db.Table(
+  'stats_rollups',
+  Column('dimension', db.String(), primary_key=True),
+  Column('bucket', db.Integer, primary_key=True),
+  Column('count', db.BigInteger, nullable=False),
+)
+
+# Width of the age buckets of the actors_age rollup
+STATS_AGE_BUCKET = 10
+
+# Buckets counted by the rollups of each table, as SQL over one of its rows
+ROLLUPS = {
+  'actors': (
+    ('actors_gender', 'CASE WHEN gender THEN 1 ELSE 0 END'),
+    ('actors_age', 'age / %d * %d' % (STATS_AGE_BUCKET, STATS_AGE_BUCKET)),
+  ),
+  'movies': (
+    ('movies_year', 'CAST(EXTRACT(YEAR FROM release_date) AS INTEGER)'),
+  ),
+}
+
+
+def rollup_upsert(table, source, sign=''):
+  buckets = ' UNION ALL '.join(
+    "SELECT '%s' AS dimension, %s AS bucket FROM %s" % (dimension, bucket, source)
+    for dimension, bucket in ROLLUPS[table])
+  return ('INSERT INTO stats_rollups (dimension, bucket, count) '
+          'SELECT dimension, bucket, %scount(*) FROM (%s) AS buckets '
+          # Concurrent writers lock the buckets in the same order, so they can't deadlock
+          'GROUP BY dimension, bucket ORDER BY dimension, bucket '
+          'ON CONFLICT (dimension, bucket) DO UPDATE SET count = stats_rollups.count + excluded.count'
+          % (sign, buckets))
+
+
+def rollup_clear(table):
+  return ('UPDATE stats_rollups SET count = 0 WHERE dimension IN (%s)'
+          % ', '.join("'%s'" % dimension for dimension, _ in ROLLUPS[table]))
+
+
+def rollup_trigger_ddl(table):
+  return [
+    """CREATE OR REPLACE FUNCTION %(table)s_stats_rollup() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    %(remove)s;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'INSERT') THEN
+    %(add)s;
+  END IF;
+  IF TG_OP = 'TRUNCATE' THEN
+    %(clear)s;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql""" % {
+      'table': table,
+      'remove': rollup_upsert(table, 'old_rows', '-'),
+      'add': rollup_upsert(table, 'new_rows'),
+      'clear': rollup_clear(table)
+    },
+    'CREATE TRIGGER %(table)s_stats_insert AFTER INSERT ON %(table)s '
+    'REFERENCING NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE %(table)s_stats_rollup()' % {'table': table},
+    'CREATE TRIGGER %(table)s_stats_update AFTER UPDATE ON %(table)s '
+    'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE %(table)s_stats_rollup()' % {'table': table},
+    'CREATE TRIGGER %(table)s_stats_delete AFTER DELETE ON %(table)s '
+    'REFERENCING OLD TABLE AS old_rows '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE %(table)s_stats_rollup()' % {'table': table},
+    # TRUNCATE has no transition table, every bucket of the table is emptied
+    'CREATE TRIGGER %(table)s_stats_truncate AFTER TRUNCATE ON %(table)s '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE %(table)s_stats_rollup()' % {'table': table},
+  ]
+
+
+def install_rollups(connection):
+  if connection.dialect.name != 'postgresql':
+    return
+  for table in ROLLUPS:
+    for statement in rollup_trigger_ddl(table):
+      connection.exec_driver_sql(statement)
+    # Count the rows the table already had
+    connection.exec_driver_sql(rollup_upsert(table, table))
+
+
+'''
+rollup_counts()
+    reads the stats rollups (see stats_rollups)
+returns (dimension, bucket, count) tuples, without the empty buckets
+'''
+def rollup_counts():
+  if db.engine.dialect.name == 'postgresql':
+    return (db.session.query(stats_rollups.c.dimension, stats_rollups.c.bucket, stats_rollups.c.count)
+            .filter(stats_rollups.c.count > 0)
+            .all())
+
+  buckets = [
+    ('actors_gender', Actor.id, case((Actor.gender, 1), else_=0)),
+    ('actors_age', Actor.id, Actor.age / STATS_AGE_BUCKET * STATS_AGE_BUCKET),
+    ('movies_year', Movie.id, cast(extract('year', Movie.release_date), Integer)),
+  ]
+  counts = []
+  for dimension, key, bucket in buckets:
+    query = db.session.query(bucket, func.count(key)).group_by(bucket)
+    counts.extend((dimension, value, count) for value, count in query)
+  return counts
+
+
+'''
+Table revisions
+Number of the last statement that wrote to each of REVISIONED_TABLES, and
+when it ran, behind the ETag and Last-Modified of the list endpoints
+    triggers bump the revision in the same transaction as the write, so it
+        is shared by every process and only visible once the write commits
+    concurrent writers of a table wait on its revision row, so revisions
+        and their modified_at follow the commit order
+'''
+table_revisions = db.Table(
+  'table_revisions',
+  Column('table_name', db.String(), primary_key=True),
+  Column('revision', db.BigInteger, nullable=False),
+  Column('modified_at', db.DateTime(timezone=True), nullable=False),
+)
+
+REVISIONED_TABLES = ('movies', 'actors', 'castings')
+
+
+def revision_trigger_ddl(dialect, table):
+  if dialect == 'postgresql':
+    return [
+      'CREATE TRIGGER %(table)s_revision AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %(table)s '
+      'FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_revision()' % {'table': table}
+    ]
+  # SQLite has no statement level triggers
+  return [
+    "CREATE TRIGGER %(table)s_revision_%(name)s AFTER %(event)s ON %(table)s BEGIN "
+    "UPDATE table_revisions SET revision = revision + 1, "
+    "modified_at = strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now') "
+    "WHERE table_name = '%(table)s'; END" % {'table': table, 'event': event, 'name': event.lower()}
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+  ]
+
+
+def install_revisions(connection):
+  dialect = connection.dialect.name
+  if dialect not in ('postgresql', 'sqlite'):
+    return
+  if dialect == 'postgresql':
+    connection.exec_driver_sql("""CREATE OR REPLACE FUNCTION bump_table_revision() RETURNS trigger AS $$
+BEGIN
+  UPDATE table_revisions SET revision = revision + 1, modified_at = clock_timestamp()
+  WHERE table_name = TG_TABLE_NAME;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql""")
+  for table in REVISIONED_TABLES:
+    connection.execute(table_revisions.insert().values(table_name=table, revision=1, modified_at=utcnow()))
+    for statement in revision_trigger_ddl(dialect, table):
+      connection.exec_driver_sql(statement)
+
+
+'''
+read_revisions(tables)
+    reads the revisions of tables with a single primary key lookup, without
+    touching the rows of the tables
+returns a list of (revision, modified_at) tuples in the order of tables
+'''
+def read_revisions(tables):
+  rows = dict((row[0], tuple(row[1:])) for row in db.session.query(
+    table_revisions.c.table_name, table_revisions.c.revision, table_revisions.c.modified_at)
+    .filter(table_revisions.c.table_name.in_(tables)))
+  return [rows[table] for table in tables]
+
+
+# SQLite only enforces foreign keys, and the ON DELETE CASCADE of castings,
+# when asked to on every connection
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+
+# The triggers are installed once every table they are on exists
+@event.listens_for(db.Model.metadata, 'after_create')
+def _install_triggers(target, connection, tables=(), **kwargs):
+  if stats_rollups in tables:
+    install_rollups(connection)
+  if table_revisions in tables:
+    install_revisions(connection)
+
+
+# The trigram indexes need the pg_trgm extension
+event.listen(
+  db.Model.metadata, 'before_create',
+  DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
@@ -0,0 +1,107 @@
+import re
+import heapq
+import threading
+import collections
+from sqlalchemy import func, literal
+
+from models import db, id_in, read_revisions
+
+
+# Minimum share of the query's trigrams a name must contain to match, the
+# default pg_trgm.word_similarity_threshold
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+# Rows read per round trip when building a fallback index
+INDEX_BATCH_SIZE = 10000
+
+WORD = re.compile(r'[^\W_]+')
+
+'''
+trigrams(text)
+    splits text in lowercase words and returns the set of trigrams of
+    each word padded with two spaces in front and one behind, like pg_trgm
+'''
+def trigrams(text):
+    grams = set()
+    for word in WORD.findall(text.lower()):
+        word = '  ' + word + ' '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+'''
+NgramIndex
+Pure-Python trigram index of a text column, used where pg_trgm isn't
+available (SQLite)
+    it maps every trigram to the ids of the rows containing it
+    search(q, limit) scores rows by the share of the trigrams of q they
+        contain, an approximation of pg_trgm's word_similarity(q, text)
+'''
+class NgramIndex:
+    def __init__(self, rows):
+        self.postings = collections.defaultdict(list)
+        for id, text in rows:
+            for gram in trigrams(text):
+                self.postings[gram].append(id)
+
+    def search(self, q, limit, threshold=WORD_SIMILARITY_THRESHOLD):
+        grams = trigrams(q)
+        if not grams:
+            return []
+
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        matches = ((count / len(grams), id) for id, count in shared.items()
+                   if count / len(grams) >= threshold)
+        return heapq.nsmallest(limit, matches, key=lambda match: (-match[0], match[1]))
+
+
+# Fallback indexes by table name, with the table revision they were built at
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+'''
+fallback_index(model, column)
+    returns the NgramIndex of column, rebuilt from the database when a
+    commit of any process wrote to the table since it was built (see
+    models.read_revisions)
+'''
+def fallback_index(model, column):
+    name = model.__tablename__
+    (revision, _), = read_revisions([name])
+    with _indexes_lock:
+        cached = _indexes.get(name)
+    if cached is not None and cached[0] == revision:
+        return cached[1]
+
+    index = NgramIndex(db.session.query(model.id, column).yield_per(INDEX_BATCH_SIZE))
+    with _indexes_lock:
+        _indexes[name] = (revision, index)
+    return index
+
+
+'''
+search(model, column, q, limit)
+    finds the rows of model whose column is similar to q, including partial
+    and misspelled matches
+    on PostgreSQL it filters with the pg_trgm q <% column operator, served
+        by the GIN trigram index of column, and ranks by word_similarity
+    other databases use the in-process NgramIndex
+returns up to limit rows as tuples of model.read_columns() followed by the
+    similarity score, best matches first and ties ordered by id
+'''
+def search(model, column, q, limit):
+    if db.engine.dialect.name == 'postgresql':
+        score = func.word_similarity(q, column).label('score')
+        return (db.session.query(*model.read_columns(), score)
+                .filter(literal(q).op('<%')(column))
+                .order_by(score.desc(), model.id)
+                .limit(limit)
+                .all())
+
+    matches = fallback_index(model, column).search(q, limit)
+    rows = {row.id: row for row in db.session.query(*model.read_columns())
+            .filter(id_in(model, [id for _, id in matches]))}
+    return [tuple(rows[id]) + (score,) for score, id in matches if id in rows]
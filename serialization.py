@@ -0,0 +1,70 @@
+import os
+import json
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON encoder of the responses: 'orjson', 'stdlib', or 'auto' to use orjson
+# when it is installed
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'auto').lower()
+
+'''
+StdlibJSONProvider
+Encodes responses with the json module of the standard library, the way
+flask.jsonify does: compact separators, sorted keys and ASCII output
+'''
+class StdlibJSONProvider:
+    name = 'stdlib'
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('ascii')
+
+
+'''
+OrjsonJSONProvider
+Encodes responses with orjson, several times faster than the standard
+library, with sorted keys so both providers produce the same documents
+'''
+class OrjsonJSONProvider:
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+
+
+def default_json_provider():
+    if JSON_PROVIDER == 'orjson' or (JSON_PROVIDER == 'auto' and orjson is not None):
+        if orjson is None:
+            raise ImportError('JSON_PROVIDER is orjson but orjson is not installed')
+        return OrjsonJSONProvider()
+    return StdlibJSONProvider()
+
+
+json_provider = default_json_provider()
+
+'''
+set_json_provider(provider)
+    replaces the encoder used by dumps and jsonify, any object with a
+    dumps(obj) method returning bytes
+'''
+def set_json_provider(provider):
+    global json_provider
+    json_provider = provider
+
+
+def dumps(obj):
+    return json_provider.dumps(obj)
+
+
+'''
+jsonify(obj)
+    drop-in replacement of flask.jsonify for a single object, encoded by
+    the current json provider
+returns a 200 application/json response
+'''
+def jsonify(obj):
+    return Response(dumps(obj) + b'\n', mimetype='application/json')
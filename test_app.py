@@ -1,11 +1,17 @@
 import os
+import time
 import unittest
 import json
+from flask import request
 from flask.json import jsonify
-from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, upgrade
+from sqlalchemy import event, text
 
-from app import create_app
-from models import setup_db, Movie, Actor
+import auth
+from app import create_app, list_query, PAGE_SIZE
+from models import db, Movie, Actor, rollup_counts
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
 
 
 class CastingAgencyTestCase(unittest.TestCase):
@@ -15,20 +21,31 @@ class CastingAgencyTestCase(unittest.TestCase):
     --> $ dropdb -U postgres capstone_test
     --> $ createdb -U postgres capstone_test
     --> $ psql -U postgres capstone_test < casting_agency.psql
+    The restored schema predates the migrations, which the test case runs
+    once before the first test (like python3 manage.py db upgrade) to add
+    the indexes, updated_at columns, castings, stats_rollups, table_revisions
+    and triggers the app expects.
     Then run the tests by running:
     --> $ python3 test_app.py
     """
 
+    @classmethod
+    def setUpClass(cls):
+        """Migrate the restored schema to the latest one once, apps don't create it."""
+        app = create_app({'DATABASE_URL': os.environ['TEST_DATABASE_URL']})
+        Migrate(app, db, directory=MIGRATIONS)
+        with app.app_context():
+            upgrade()
+
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_path = os.environ['TEST_DATABASE_URL']
         # Fix for 'postgresql' instead of 'postgres'
         if self.database_path[0:8] == 'postgres':
             if self.database_path[8:10] != 'ql':
                 self.database_path = self.database_path[:8]+'ql' + self.database_path[8:]
-        setup_db(self.app, self.database_path)
+        self.app = create_app({'DATABASE_URL': self.database_path})
+        self.client = self.app.test_client
 
         # Movie to be inserted to database
         self.new_movie = {
@@ -50,13 +67,6 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.executive_producer_token = os.environ['EXECUTIVE_PRODUCER_TOKEN']
         self.casting_director_token = os.environ['CASTING_DIRECTOR_TOKEN']
         self.casting_assistant_token = os.environ['CASTING_ASSISTANT_TOKEN']
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
     
 
     def tearDown(self):
@@ -132,6 +142,382 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['description'], 'Authorization header is expected.')
 
 
+    def test_get_movies_paginated(self):
+        """
+        GET request for '/movies' endpoint with ?limit= should return
+        at most limit movies and the cursor of the next page.
+        """
+        res = self.client().get(
+            '/movies?limit=1',
+            headers={
+                'Authorization': 'Bearer ' + self.casting_assistant_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['movies']), 1)
+        self.assertEqual(data['next_cursor'], data['movies'][0]['id'])
+
+        res = self.client().get(
+            '/movies?limit=1&after=' + str(data['next_cursor']),
+            headers={
+                'Authorization': 'Bearer ' + self.casting_assistant_token
+            })
+        next_page = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(next_page['movies']), 1)
+        self.assertTrue(next_page['movies'][0]['id'] > data['next_cursor'])
+
+
+    def test_get_actors_all_streamed(self):
+        """
+        GET request for '/actors' endpoint with ?all=true should stream
+        every actor in a single response without a next page.
+        """
+        res = self.client().get(
+            '/actors?all=true',
+            headers={
+                'Authorization': 'Bearer ' + self.casting_assistant_token
+            })
+        # Checked before .data, which buffers the response
+        self.assertTrue(res.is_streamed)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['actors'])
+        self.assertEqual(data['next_cursor'], None)
+        ids = [actor['id'] for actor in data['actors']]
+        self.assertEqual(ids, sorted(ids))
+
+
+    def test_400_get_actors_invalid_limit(self):
+        """
+        GET request for '/actors' endpoint should return bad request 400
+        if ?limit= isn't a positive integer.
+        """
+        res = self.client().get(
+            '/actors?limit=0',
+            headers={
+                'Authorization': 'Bearer ' + self.casting_assistant_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
+    def test_get_actors_filtered_and_sorted(self):
+        """
+        GET request for '/actors' endpoint should only return the actors
+        matching the filters, in the requested order.
+        """
+        res = self.client().get(
+            '/actors?gender=male&min_age=20&max_age=60&sort=-age',
+            headers={
+                'Authorization': 'Bearer ' + self.casting_assistant_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        ages = [actor['age'] for actor in data['actors']]
+        self.assertEqual(ages, sorted(ages, reverse=True))
+        self.assertTrue(all(20 <= age <= 60 for age in ages))
+        self.assertTrue(all(actor['gender'] == 'male' for actor in data['actors']))
+
+
+    def test_400_get_movies_invalid_filter(self):
+        """
+        GET request for '/movies' endpoint should return bad request 400
+        if a filter or the sort isn't valid.
+        """
+        for query in ['released_after=2021-01-01', 'sort=budget']:
+            res = self.client().get(
+                '/movies?' + query,
+                headers={
+                    'Authorization': 'Bearer ' + self.casting_assistant_token
+                })
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], 'bad request')
+
+
+    def test_list_filters_use_indexes(self):
+        """
+        The filters and sorts of the list endpoints should be served by
+        indexes, without sequential scans, on large tables.
+        The rows added for the test are rolled back.
+        It relies on generate_series and EXPLAIN, so it only runs on PostgreSQL.
+        """
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('index plans are only checked on PostgreSQL')
+        urls = [
+            (Actor, '/actors?sort=-id'),
+            (Actor, '/actors?min_age=30&max_age=31&sort=age'),
+            (Actor, '/actors?gender=male&min_age=30&max_age=30'),
+            (Actor, '/actors?sort=-name'),
+            (Movie, '/movies?released_after=January 01, 1960&released_before=January 31, 1960'),
+            (Movie, '/movies?title_prefix=Movie 123'),
+            (Movie, '/movies?sort=-release_date'),
+        ]
+        with self.app.app_context():
+            try:
+                db.session.execute(text(
+                    "INSERT INTO actors (name, age, gender) "
+                    "SELECT 'Actor ' || i, 18 + i % 70, i % 2 = 0 FROM generate_series(1, 100000) i"))
+                db.session.execute(text(
+                    "INSERT INTO movies (title, release_date) "
+                    "SELECT 'Movie ' || i, date '1950-01-01' + i % 25000 FROM generate_series(1, 100000) i"))
+                db.session.execute(text('ANALYZE actors'))
+                db.session.execute(text('ANALYZE movies'))
+
+                for model, url in urls:
+                    with self.app.test_request_context(url):
+                        query = list_query(model, request.args)[0].limit(PAGE_SIZE + 1)
+                    statement = query.statement.compile(dialect=db.engine.dialect)
+                    plan = db.session.connection().exec_driver_sql(
+                        'EXPLAIN ' + str(statement), statement.params).fetchall()
+                    plan = '\n'.join(row[0] for row in plan)
+                    self.assertNotIn('Seq Scan', plan, url + '\n' + plan)
+            finally:
+                db.session.rollback()
+
+
+    def test_search_actors_misspelled_name(self):
+        """
+        GET request for '/actors/search' endpoint should find actors by
+        a partial or misspelled name, best matches first.
+        """
+        res = self.client().post(
+            '/actors',
+            json=self.new_actor,
+            headers={
+                'Authorization': 'Bearer ' + self.casting_director_token
+            })
+        actor_id = json.loads(res.data)['actors'][0]['id']
+
+        res = self.client().get(
+            '/actors/search?q=danel crai',
+            headers={
+                'Authorization': 'Bearer ' + self.casting_assistant_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn(actor_id, [actor['id'] for actor in data['actors']])
+        scores = [actor['score'] for actor in data['actors']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+    def test_400_search_movies_without_query(self):
+        """
+        GET request for '/movies/search' endpoint should return bad request
+        400 if ?q= is missing or blank.
+        """
+        for url in ['/movies/search', '/movies/search?q=%20']:
+            res = self.client().get(
+                url,
+                headers={
+                    'Authorization': 'Bearer ' + self.casting_assistant_token
+                })
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['message'], 'bad request')
+
+
+    def test_assign_actor_to_movie_casting_director_role(self):
+        """
+        PUT request for '/movies/<movie_id>/actors/<actor_id>' endpoint
+        should cast the actor in the movie, and DELETE should remove it.
+        It requires 'patch:movies' permission.
+        """
+        headers = {'Authorization': 'Bearer ' + self.executive_producer_token}
+        movie_id = json.loads(self.client().post(
+            '/movies', json=self.new_movie, headers=headers).data)['movies'][0]['id']
+        actor_id = json.loads(self.client().post(
+            '/actors', json=self.new_actor, headers=headers).data)['actors'][0]['id']
+        url = '/movies/%d/actors/%d' % (movie_id, actor_id)
+        headers = {'Authorization': 'Bearer ' + self.casting_director_token}
+
+        res = self.client().put(url, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/movies/%d/actors' % movie_id, headers=headers)
+        self.assertEqual([actor['id'] for actor in json.loads(res.data)['actors']], [actor_id])
+        res = self.client().get('/actors/%d/movies' % actor_id, headers=headers)
+        self.assertEqual([movie['id'] for movie in json.loads(res.data)['movies']], [movie_id])
+
+        res = self.client().delete(url, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client().delete(url, headers=headers)
+        self.assertEqual(res.status_code, 404)
+
+
+    def test_get_movies_include_actors_query_count(self):
+        """
+        GET request for '/movies?include=actors' endpoint should load the
+        casts of a page of movies with a fixed number of queries, whatever
+        the size of the page.
+        """
+        headers = {'Authorization': 'Bearer ' + self.executive_producer_token}
+        actor_id = json.loads(self.client().post(
+            '/actors', json=self.new_actor, headers=headers).data)['actors'][0]['id']
+        for _ in range(10):
+            movie_id = json.loads(self.client().post(
+                '/movies', json=self.new_movie, headers=headers).data)['movies'][0]['id']
+            self.client().put('/movies/%d/actors/%d' % (movie_id, actor_id), headers=headers)
+
+        counts = []
+        with self.app.app_context():
+            engine = db.engine
+        for limit in (1, 10):
+            queries = []
+            listener = lambda *args: queries.append(args[2])
+            event.listen(engine, 'before_cursor_execute', listener)
+            try:
+                res = self.client().get(
+                    '/movies?include=actors&sort=-id&limit=%d' % limit, headers=headers)
+            finally:
+                event.remove(engine, 'before_cursor_execute', listener)
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(data['movies']), limit)
+            self.assertTrue(all(movie['actors'] for movie in data['movies']))
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+
+    def test_get_stats_follow_writes(self):
+        """
+        GET request for '/stats' endpoint should return the counts of
+        actors and movies, updated by every write.
+        """
+        headers = {'Authorization': 'Bearer ' + self.casting_assistant_token}
+        before = json.loads(self.client().get('/stats', headers=headers).data)
+        self.client().post(
+            '/actors',
+            json=self.new_actor,
+            headers={
+                'Authorization': 'Bearer ' + self.casting_director_token
+            })
+        res = self.client().get('/stats', headers=headers)
+        after = json.loads(res.data)
+
+        def age_count(stats):
+            return sum(bucket['count'] for bucket in stats['actors']['by_age']
+                       if bucket['min_age'] <= self.new_actor['age'] <= bucket['max_age'])
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(after['success'], True)
+        self.assertEqual(after['actors']['total'], before['actors']['total'] + 1)
+        self.assertEqual(after['actors']['by_gender']['male'], before['actors']['by_gender']['male'] + 1)
+        self.assertEqual(age_count(after), age_count(before) + 1)
+        self.assertEqual(after['movies'], before['movies'])
+
+
+    def test_stats_rollups_emptied_by_truncate(self):
+        """
+        A TRUNCATE of actors should empty their stats rollups. It is rolled
+        back so the other tests keep their rows.
+        """
+        with self.app.app_context():
+            try:
+                db.session.execute(text('TRUNCATE actors CASCADE'))
+                dimensions = set(dimension for dimension, _, _ in rollup_counts())
+            finally:
+                db.session.rollback()
+
+        self.assertNotIn('actors_gender', dimensions)
+        self.assertNotIn('actors_age', dimensions)
+        self.assertIn('movies_year', dimensions)
+
+
+    def test_get_actors_cached_until_write(self):
+        """
+        GET request for '/actors' endpoint should be served from the
+        response cache until an actor is written.
+        """
+        headers = {'Authorization': 'Bearer ' + self.casting_assistant_token}
+        first = self.client().get('/actors?sort=-id', headers=headers)
+        second = self.client().get('/actors?sort=-id', headers=headers)
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+
+        res = self.client().post(
+            '/actors',
+            json=self.new_actor,
+            headers={
+                'Authorization': 'Bearer ' + self.casting_director_token
+            })
+        actor_id = json.loads(res.data)['actors'][0]['id']
+        third = self.client().get('/actors?sort=-id', headers=headers)
+
+        self.assertEqual(third.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(third.data)['actors'][0]['id'], actor_id)
+
+
+    def test_get_movies_not_modified(self):
+        """
+        GET request for '/movies' endpoint should return 304 without a
+        body while the ETag sent in If-None-Match is still current, and
+        the new movies once a movie is written.
+        """
+        headers = {'Authorization': 'Bearer ' + self.casting_assistant_token}
+        res = self.client().get('/movies', headers=headers)
+        etag = res.headers['ETag']
+        self.assertTrue(res.headers['Last-Modified'])
+
+        res = self.client().get('/movies', headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        self.client().post(
+            '/movies',
+            json=self.new_movie,
+            headers={
+                'Authorization': 'Bearer ' + self.executive_producer_token
+            })
+        res = self.client().get('/movies', headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+
+    def test_get_actor_not_modified_until_patched(self):
+        """
+        GET request for '/actors/<actor_id>' endpoint should return 304
+        until the actor is updated.
+        """
+        res = self.client().post(
+            '/actors',
+            json=self.new_actor,
+            headers={
+                'Authorization': 'Bearer ' + self.casting_director_token
+            })
+        actor_id = json.loads(res.data)['actors'][0]['id']
+        headers = {'Authorization': 'Bearer ' + self.casting_director_token}
+
+        res = self.client().get('/actors/%d' % actor_id, headers=headers)
+        self.assertEqual(res.status_code, 200)
+        etag = res.headers['ETag']
+        res = self.client().get('/actors/%d' % actor_id, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 304)
+
+        self.client().patch('/actors/%d' % actor_id, json={'age': 54}, headers=headers)
+        res = self.client().get('/actors/%d' % actor_id, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['actors'][0]['age'], 54)
+
+
     def test_post_movies_executive_producer_role(self):
         """
         POST request for '/movies' endpoint should return a list of
@@ -265,6 +651,113 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'bad request')
 
 
+    def test_post_movies_bulk_executive_producer_role(self):
+        """
+        POST request for '/movies/bulk' endpoint should create every valid
+        movie and report the invalid ones by index.
+        It requires 'post:movies' permission.
+        Executive Producer role is used to make request.
+        """
+        res = self.client().post(
+            '/movies/bulk',
+            json={'movies': [self.new_movie, self.empty_json, self.new_movie]},
+            headers={
+                'Authorization': 'Bearer ' + self.executive_producer_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual([item['index'] for item in data['created']], [0, 2])
+        self.assertTrue(all(item['id'] for item in data['created']))
+        self.assertEqual([error['index'] for error in data['errors']], [1])
+
+
+    def test_400_post_actors_bulk_atomic(self):
+        """
+        POST request for '/actors/bulk' endpoint with atomic set should
+        create nothing if any actor is invalid.
+        It requires 'post:actors' permission.
+        Casting Director role is used to make request.
+        """
+        res = self.client().post(
+            '/actors/bulk',
+            json={'actors': [self.new_actor, self.new_movie], 'atomic': True},
+            headers={
+                'Authorization': 'Bearer ' + self.casting_director_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+        self.assertEqual([error['index'] for error in data['errors']], [1])
+
+
+    def test_post_actors_bulk_reads_no_rows_back(self):
+        """
+        POST request for '/actors/bulk' endpoint should get the ids of the
+        new actors from the INSERT, without selecting them back.
+        Casting Director role is used to make request.
+        """
+        with self.app.app_context():
+            engine = db.engine
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            res = self.client().post(
+                '/actors/bulk',
+                json={'actors': [self.new_actor] * 20},
+                headers={
+                    'Authorization': 'Bearer ' + self.casting_director_token
+                })
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(set(item['id'] for item in data['created'])), 20)
+        self.assertEqual([statement for statement in statements
+                          if statement.lstrip().upper().startswith('SELECT')], [])
+
+
+    def test_422_post_actors_age_not_integer(self):
+        """
+        POST request for '/actors' endpoint should return unprocessable 422
+        if the age is a float, a boolean or a string.
+        Casting Director role is used to make request.
+        """
+        for age in (41.9, True, '41'):
+            res = self.client().post(
+                '/actors',
+                json=dict(self.new_actor, age=age),
+                headers={
+                    'Authorization': 'Bearer ' + self.casting_director_token
+                })
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(data['success'], False)
+
+
+    def test_403_post_movies_bulk_casting_director_role(self):
+        """
+        POST request for '/movies/bulk' endpoint requires 'post:movies' permission.
+        Casting Director doesn't have the required permission.
+        """
+        res = self.client().post(
+            '/movies/bulk',
+            json={'movies': [self.new_movie]},
+            headers={
+                'Authorization': 'Bearer ' + self.casting_director_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(data['description'], 'Permission not found')
+
+
     def test_patch_movies_executive_producer_role(self):
         """
         PACTH request for '/movies/<int:movie_id>' endpoint should return a list of movies with only the updated movie.
@@ -359,6 +852,26 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'resource not found')
 
 
+    def test_404_patch_movies_nonexistant_id_empty_json(self):
+        """
+        PACTH request for '/movies/<int:movie_id>' endpoint requires 'patch:movies' permission.
+        Executive producer role is used to make request.
+        It should return not found 404 because of movie_id=1000 not found, before checking the empty json.
+        """
+        res = self.client().patch(
+            '/movies/1000',
+            json=self.empty_json,
+            headers={
+                'Authorization': 'Bearer ' + self.executive_producer_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+        self.assertEqual(data['message'], 'resource not found')
+
+
     def test_patch_actors_executive_producer_role(self):
         """
         PACTH request for '/actors/<int:actor_id>' endpoint should return a list of actors with only the updated actor.
@@ -457,6 +970,88 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'resource not found')
 
 
+    def test_404_patch_actors_nonexistant_id_age_not_integer(self):
+        """
+        PACTH request for '/actors/<int:actors_id>' endpoint requires 'patch:actors' permission.
+        Executive producer role is used to make request.
+        It should return not found 404 because of actor_id=1000 not found, before checking the age.
+        """
+        res = self.client().patch(
+            '/actors/1000',
+            json={
+                'age': '25'
+            },
+            headers={
+                'Authorization': 'Bearer ' + self.executive_producer_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+        self.assertEqual(data['message'], 'resource not found')
+
+
+    def test_patch_actors_bulk_casting_director_role(self):
+        """
+        PATCH request for '/actors/bulk' endpoint should update every
+        listed actor and report the ids that don't exist.
+        It requires 'patch:actors' permission.
+        Casting Director role is used to make request.
+        """
+        res = self.client().patch(
+            '/actors/bulk',
+            json={'ids': [1, 1000], 'patch': {'age': 36}},
+            headers={
+                'Authorization': 'Bearer ' + self.casting_director_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['updated'], [1])
+        self.assertEqual(data['not_found'], [1000])
+
+
+    def test_400_patch_movies_bulk_empty_patch(self):
+        """
+        PATCH request for '/movies/bulk' endpoint should return bad request 400
+        if the patch document has nothing to update.
+        """
+        res = self.client().patch(
+            '/movies/bulk',
+            json={'ids': [1], 'patch': self.empty_json},
+            headers={
+                'Authorization': 'Bearer ' + self.executive_producer_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+
+    def test_delete_movies_bulk_executive_producer_role(self):
+        """
+        DELETE request for '/movies/bulk' endpoint should report the ids
+        it deleted and the ones it didn't find.
+        It requires 'delete:movies' permission.
+        Executive Producer role is used to make request.
+        """
+        res = self.client().delete(
+            '/movies/bulk',
+            json={'ids': [1000, 1001]},
+            headers={
+                'Authorization': 'Bearer ' + self.executive_producer_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted'], [])
+        self.assertEqual(data['not_found'], [1000, 1001])
+
+
     def test_403_delete_movies_casting_director_role(self):
         """
         DELETE request for '/movies/<int:movie_id>' endpoint requires 'delete:movies' permission.
@@ -588,6 +1183,105 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['delete'], 2)
 
 
+    def test_create_app_without_database(self):
+        """
+        create_app should neither connect to the database nor create the
+        schema, so it succeeds even when the database is unreachable.
+        """
+        app = create_app({'DATABASE_URL': 'postgresql://nobody@127.0.0.1:1/unreachable'})
+        self.assertIn('/movies', [rule.rule for rule in app.url_map.iter_rules()])
+
+
+    def test_get_pool_stats_casting_assistant_role(self):
+        """
+        GET request for '/stats/pool' endpoint should report the pool of
+        the primary and of every replica.
+        It requires 'get:actors' and 'get:movies' permissions.
+        Casting Assistant role is used to make request.
+        """
+        res = self.client().get(
+            '/stats/pool',
+            headers={
+                'Authorization': 'Bearer ' + self.casting_assistant_token
+            })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['pools']['primary']['pool'])
+        self.assertEqual(data['pools']['replicas'], [])
+
+
+    def test_healthz_without_token(self):
+        """GET request for '/healthz' endpoint should succeed without a token."""
+        res = self.client().get('/healthz')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+
+    def test_readyz_after_warm_up(self):
+        """
+        GET request for '/readyz' endpoint should fail while the warm-up runs,
+        and succeed without a token once it succeeded.
+        The keys are served locally, so the warm-up doesn't depend on Auth0.
+        """
+        self.addCleanup(auth.set_key_store, auth.key_store)
+        auth.set_key_store(auth.JWKSKeyStore(lambda: {'keys': []}))
+        app = create_app({'DATABASE_URL': self.database_path, 'WARM_UP': True})
+        client = app.test_client()
+        for _ in range(100):
+            res = client.get('/readyz')
+            if res.status_code == 200:
+                break
+            self.assertEqual(res.status_code, 503)
+            time.sleep(0.1)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['checks']['warm_up'], 'done')
+        self.assertEqual(data['checks']['jwks'], True)
+        self.assertIn('queries', data['checks']['warm_up_ms'])
+
+
+    def test_503_readyz_after_failed_warm_up(self):
+        """
+        GET request for '/readyz' endpoint should fail while the warm-up
+        failed and the JWKS isn't loaded, without retrying it.
+        """
+        def unreachable():
+            raise OSError('Auth0 is unreachable')
+        self.addCleanup(auth.set_key_store, auth.key_store)
+        auth.set_key_store(auth.JWKSKeyStore(unreachable))
+        app = create_app({'DATABASE_URL': self.database_path, 'WARM_UP': True})
+        warm_up = app.extensions['warm_up']
+        self.addCleanup(warm_up.stop)
+        for _ in range(100):
+            if warm_up.state == 'failed':
+                break
+            time.sleep(0.1)
+        attempts = warm_up.attempts
+        client = app.test_client()
+        for _ in range(10):
+            res = client.get('/readyz')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['checks']['warm_up'], 'failed')
+        self.assertEqual(data['checks']['jwks'], False)
+        # Probes only read the state, the warm-up retries on its own schedule
+        self.assertEqual(warm_up.attempts, attempts)
+
+
+    def test_every_route_has_a_benchmark_scenario(self):
+        """Every route of the app should be driven by the endpoints benchmark."""
+        from benchmarks.endpoints import SCENARIOS, uncovered_routes
+
+        self.assertEqual(uncovered_routes(self.app, SCENARIOS), [])
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
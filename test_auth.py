@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from unittest import mock
+from flask import Flask, jsonify
+
+import auth
+import cache
+from auth import AuthError, JWKSKeyStore, TokenCache, file_jwks_fetcher, verify_decode_jwt
+from testing import FakeClock, generate_signing_key, setup_test_auth, sign_test_token
+
+
+class CountingFetcher:
+    def __init__(self, jwks):
+        self.jwks = jwks
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.jwks
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """
+    This class represents the JWKS key store test case
+    It runs offline against locally generated keys.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.jwks = generate_signing_key('test-key')
+        cls.public_jwk, = cls.jwks['keys']
+
+    def setUp(self):
+        setup_test_auth(self)
+        self.clock = FakeClock()
+        self.fetcher = CountingFetcher(self.jwks)
+        self.store = JWKSKeyStore(
+            self.fetcher, ttl=10, stale_ttl=100,
+            min_refetch_interval=5, clock=self.clock)
+
+    def tearDown(self):
+        auth.set_key_store(auth.JWKSKeyStore(auth.auth0_jwks_fetcher()))
+
+    def test_fresh_keys_are_fetched_once(self):
+        """Keys younger than the TTL should be served from memory"""
+        for _ in range(100):
+            self.assertEqual(self.store.get_key('test-key'), self.public_jwk)
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_stale_keys_are_served_while_revalidating(self):
+        """Keys past the TTL should be served while a refresh runs"""
+        self.store.get_key('test-key')
+        self.clock.now = 50
+        self.assertEqual(self.store.get_key('test-key'), self.public_jwk)
+
+        # Wait for the background refresh to finish
+        for _ in range(100):
+            if self.fetcher.calls == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_failed_background_refresh_is_rate_limited(self):
+        """A failing refresh of stale keys should be retried at most once per interval"""
+        self.store.get_key('test-key')
+
+        def unreachable():
+            self.fetcher.calls += 1
+            raise OSError('timed out')
+        self.store.fetcher = unreachable
+        self.clock.now = 50
+        with self.assertLogs(auth.logger, 'WARNING'):
+            self.store.get_key('test-key')
+            for _ in range(100):
+                if not self.store._refreshing:
+                    break
+                time.sleep(0.01)
+        for _ in range(10):
+            self.assertEqual(self.store.get_key('test-key'), self.public_jwk)
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_expired_keys_are_refreshed_inline(self):
+        """Keys past the TTL and the stale TTL should be refetched first"""
+        self.store.get_key('test-key')
+        self.clock.now = 200
+        self.store.get_key('test-key')
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        """An unknown kid should refetch at most once per interval"""
+        self.store.get_key('test-key')
+        self.clock.now = 6
+        for _ in range(10):
+            self.assertIsNone(self.store.get_key('unknown'))
+        self.assertEqual(self.fetcher.calls, 2)
+
+        self.clock.now = 12
+        self.store.get_key('unknown')
+        self.assertEqual(self.fetcher.calls, 3)
+
+    def test_loaded_keys_refetch_a_rotated_kid(self):
+        """Keys loaded from elsewhere should still refetch an unknown kid, rate limited"""
+        _, rotated = generate_signing_key('rotated')
+        rotated_jwk, = rotated['keys']
+        self.fetcher.jwks = {'keys': [self.public_jwk, rotated_jwk]}
+        self.store.load(self.jwks)
+        self.assertIsNotNone(self.store.get_public_key('test-key'))
+        self.assertIsNone(self.store.get_public_key('rotated'))
+        self.assertEqual(self.fetcher.calls, 0)
+
+        self.clock.now = 6
+        self.assertIsNotNone(self.store.get_public_key('rotated'))
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_failed_inline_fetch_is_rate_limited(self):
+        """Without keys, an unreachable Auth0 should be asked at most once per interval"""
+        def unreachable():
+            self.fetcher.calls += 1
+            raise OSError('timed out')
+        self.store.fetcher = unreachable
+        for _ in range(10):
+            self.assertIsNone(self.store.get_key('test-key'))
+        self.assertEqual(self.fetcher.calls, 1)
+
+        self.store.fetcher = self.fetcher
+        self.clock.now = 6
+        self.assertEqual(self.store.get_key('test-key'), self.public_jwk)
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_concurrent_inline_fetches_are_single_flight(self):
+        """Concurrent lookups without keys should share a single fetch"""
+        def slow():
+            time.sleep(0.05)
+            return self.fetcher()
+        self.store.fetcher = slow
+        with ThreadPoolExecutor(8) as pool:
+            keys = list(pool.map(lambda _: self.store.get_key('test-key'), range(8)))
+        self.assertEqual(keys, [self.public_jwk] * 8)
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_public_keys_are_prepared_once_per_refresh(self):
+        """Keys should be parsed on refresh, not on every lookup"""
+        fetcher = CountingFetcher({'keys': [self.public_jwk, {'kty': 'EC', 'kid': 'ec-key'}]})
+        store = JWKSKeyStore(fetcher, clock=self.clock)
+        with mock.patch.object(auth.jwk, 'construct', wraps=auth.jwk.construct) as construct:
+            for _ in range(10):
+                self.assertIsNotNone(store.get_public_key('test-key'))
+        self.assertEqual(construct.call_count, 1)
+        self.assertIsNone(store.get_public_key('ec-key'))
+
+    def test_verify_decode_jwt_with_local_jwks_file(self):
+        """verify_decode_jwt should accept tokens signed by a key in a local JWKS file"""
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(self.jwks, f)
+        self.addCleanup(os.remove, f.name)
+        auth.set_key_store(JWKSKeyStore(file_jwks_fetcher(f.name)))
+
+        token = sign_test_token(self.pem, 'test-key', ['get:movies'])
+        payload = verify_decode_jwt(token)
+        self.assertEqual(payload['permissions'], ['get:movies'])
+
+        unknown = sign_test_token(self.pem, 'rotated-key', ['get:movies'])
+        with self.assertRaises(AuthError) as ctx:
+            verify_decode_jwt(unknown)
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """
+    This class represents the verified token cache test case
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.jwks = generate_signing_key('test-key')
+
+    def setUp(self):
+        setup_test_auth(self)
+        auth.set_key_store(JWKSKeyStore(CountingFetcher(self.jwks)))
+        auth.token_cache.clear()
+
+    def tearDown(self):
+        auth.set_key_store(auth.JWKSKeyStore(auth.auth0_jwks_fetcher()))
+        auth.token_cache.clear()
+
+    def test_repeated_token_skips_verification(self):
+        """A token seen before should not be decoded again"""
+        token = sign_test_token(self.pem, 'test-key', ['get:actors'])
+        with mock.patch.object(auth.jwt, 'decode', wraps=auth.jwt.decode) as decode:
+            first = verify_decode_jwt(token)
+            for _ in range(10):
+                self.assertEqual(verify_decode_jwt(token), first)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_entries_expire_with_the_token(self):
+        """A cached payload should be served up to and including its exp second"""
+        clock = FakeClock()
+        cache = TokenCache(maxsize=10, clock=clock)
+        cache.set('token', {'exp': 100})
+        clock.now = 100.9
+        self.assertEqual(cache.get('token'), {'exp': 100})
+        clock.now = 101
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(len(cache), 0)
+
+    def test_cache_is_bounded(self):
+        """The least recently used entry should be evicted first"""
+        cache = TokenCache(maxsize=2, clock=FakeClock())
+        cache.set('a', {'exp': 1})
+        cache.set('b', {'exp': 1})
+        cache.get('a')
+        cache.set('c', {'exp': 1})
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_revoked_tokens_are_verified_again(self):
+        """revoke_token and revoke_subject should evict cached payloads"""
+        token = sign_test_token(self.pem, 'test-key', ['get:actors'])
+        verify_decode_jwt(token)
+        auth.revoke_token(token)
+        self.assertIsNone(auth.token_cache.get(token))
+
+        verify_decode_jwt(token)
+        auth.revoke_subject('auth0|test')
+        self.assertIsNone(auth.token_cache.get(token))
+
+
+class AuthTimingTestCase(unittest.TestCase):
+    """
+    This class represents the requires_auth timing breakdown test case
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.jwks = generate_signing_key('test-key')
+
+    def setUp(self):
+        setup_test_auth(self)
+        auth.set_key_store(JWKSKeyStore(CountingFetcher(self.jwks)))
+        auth.token_cache.clear()
+
+        self.app = Flask(__name__)
+        self.app.after_request(auth.add_server_timing)
+
+        @self.app.route('/protected')
+        @auth.requires_auth('get:movies')
+        def protected(payload):
+            return jsonify({'success': True})
+
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        auth.set_key_store(auth.JWKSKeyStore(auth.auth0_jwks_fetcher()))
+        auth.token_cache.clear()
+
+    def test_server_timing_header(self):
+        """Every requires_auth stage should be reported in Server-Timing"""
+        token = sign_test_token(self.pem, 'test-key', ['get:movies'])
+        with mock.patch.object(auth, 'AUTH_SERVER_TIMING', True):
+            res = self.client().get('/protected', headers={'Authorization': 'Bearer ' + token})
+
+        self.assertEqual(res.status_code, 200)
+        metrics = [metric.split(';')[0] for metric in res.headers['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, [
+            'auth-header', 'auth-token-cache', 'auth-jwks', 'auth-decode',
+            'auth-permissions', 'auth'])
+
+    def test_server_timing_header_is_opt_in(self):
+        """Server-Timing should only be sent when AUTH_SERVER_TIMING is set"""
+        token = sign_test_token(self.pem, 'test-key', ['get:movies'])
+        with mock.patch.object(auth, 'AUTH_SERVER_TIMING', False):
+            res = self.client().get('/protected', headers={'Authorization': 'Bearer ' + token})
+        self.assertNotIn('Server-Timing', res.headers)
+
+
+class RequiredPermissionsTestCase(unittest.TestCase):
+    """
+    This class represents the requires_auth permissions test case
+    Conditional requests are answered by cache.cached, whose validators
+    are stubbed so it runs without a database.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.jwks = generate_signing_key('test-key')
+
+    def setUp(self):
+        setup_test_auth(self)
+        auth.set_key_store(JWKSKeyStore(CountingFetcher(self.jwks)))
+        auth.token_cache.clear()
+
+        self.app = Flask(__name__)
+
+        @self.app.errorhandler(AuthError)
+        def auth_error(error):
+            return jsonify(error.error), error.status_code
+
+        @self.app.route('/stats')
+        @auth.requires_auth('get:actors', 'get:movies')
+        @cache.cached('actors', 'movies')
+        def stats(payload):
+            return jsonify({'success': True})
+
+        self.client = self.app.test_client
+        validators = mock.patch.object(
+            cache, 'validators', return_value=('stats.1', datetime(2022, 1, 1, tzinfo=timezone.utc)))
+        validators.start()
+        self.addCleanup(validators.stop)
+
+    def tearDown(self):
+        auth.set_key_store(auth.JWKSKeyStore(auth.auth0_jwks_fetcher()))
+        auth.token_cache.clear()
+
+    def get(self, permissions, headers=None):
+        token = sign_test_token(self.pem, 'test-key', permissions)
+        return self.client().get('/stats', headers=dict(headers or {}, Authorization='Bearer ' + token))
+
+    def test_every_permission_is_required(self):
+        """A token missing one of the permissions should be forbidden"""
+        self.assertEqual(self.get(['get:actors', 'get:movies']).status_code, 200)
+        self.assertEqual(self.get(['get:actors']).status_code, 403)
+        self.assertEqual(self.get(['get:movies']).status_code, 403)
+
+    def test_conditional_request_checks_every_permission(self):
+        """A matching If-None-Match shouldn't get a 304 past a missing permission"""
+        headers = {'If-None-Match': '"stats.1"'}
+        self.assertEqual(self.get(['get:actors', 'get:movies'], headers).status_code, 304)
+        self.assertEqual(self.get(['get:actors'], headers).status_code, 403)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from flask import jsonify
+from sqlalchemy import create_engine, event
+
+import cache
+import models
+from cache import ResponseCache, cached
+from models import Movie, create_schema
+from testing import FakeClock, create_test_app
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """
+    This class represents the response cache test case
+    It runs offline, without a database.
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResponseCache(maxsize=3, max_bytes=100, ttl=10, clock=self.clock)
+
+    def test_entries_are_invalidated_by_table_versions(self):
+        """An entry should only be served while its table versions are unchanged"""
+        self.cache.set('key', (1, 1), (b'body', 200, 'application/json'))
+        self.assertEqual(self.cache.get('key', (1, 1)), (b'body', 200, 'application/json'))
+        self.assertIsNone(self.cache.get('key', (1, 2)))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_entries_expire_after_ttl(self):
+        """An entry should not be served once it is ttl seconds old"""
+        self.cache.set('key', (1,), (b'body', 200, 'application/json'))
+        self.clock.now = 9.9
+        self.assertIsNotNone(self.cache.get('key', (1,)))
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('key', (1,)))
+
+    def test_cache_is_bounded_by_entries_and_bytes(self):
+        """The least recently used entries should be evicted first"""
+        for key in 'abc':
+            self.cache.set(key, (1,), (b'x' * 10, 200, 'application/json'))
+        self.cache.get('a', (1,))
+        self.cache.set('d', (1,), (b'x' * 10, 200, 'application/json'))
+        self.assertIsNone(self.cache.get('b', (1,)))
+
+        self.cache.set('e', (1,), (b'x' * 90, 200, 'application/json'))
+        self.assertEqual(self.cache.stats()['bytes'], 100)
+        self.assertIsNotNone(self.cache.get('e', (1,)))
+        self.cache.set('f', (1,), (b'x' * 101, 200, 'application/json'))
+        self.assertIsNone(self.cache.get('f', (1,)))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['evictions'], 3)
+        self.assertEqual(stats['hits'], 2)
+
+
+class CachedEndpointTestCase(unittest.TestCase):
+    """
+    This class represents the cached endpoint test case
+    It runs offline against a throwaway SQLite file, written to by the app
+    and by a separate engine like another worker would.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.app = create_test_app(self.directory)
+        with self.app.app_context():
+            create_schema()
+        self.clock = FakeClock()
+        self.response_cache = cache.response_cache
+        cache.set_response_cache(ResponseCache(ttl=5, clock=self.clock))
+
+        @cached('movies')
+        def get_movies(payload):
+            return jsonify([title for title, in models.db.session.query(Movie.title)])
+        self.get_movies = get_movies
+
+    def tearDown(self):
+        cache.set_response_cache(self.response_cache)
+
+    def request(self):
+        with self.app.test_request_context('/movies'):
+            response = self.get_movies({'permissions': ['get:movies']})
+            models.db.session.remove()
+            return response
+
+    def test_hits_do_not_query_the_database(self):
+        """A cached response should be served, with its ETag, without any statement"""
+        first = self.request()
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+
+        statements = []
+        with self.app.app_context():
+            engine = models.db.engine
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', listener)
+        second = self.request()
+
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.get_etag(), first.get_etag())
+        self.assertEqual(statements, [])
+
+    def test_local_writes_invalidate_entries(self):
+        """A commit of this process should invalidate its cached responses at once"""
+        first = self.request()
+        with self.app.app_context():
+            Movie(title='Heat', release_date=date(1995, 12, 15)).insert()
+
+        second = self.request()
+        self.assertEqual(second.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.get_json(), ['Heat'])
+        self.assertNotEqual(second.get_etag(), first.get_etag())
+
+    def test_writes_of_other_workers_show_after_ttl(self):
+        """A write committed outside this process should show once the entry expired"""
+        first = self.request()
+        other_worker = create_engine(self.app.config['SQLALCHEMY_DATABASE_URI'])
+        with other_worker.begin() as connection:
+            connection.execute(Movie.__table__.insert(),
+                               {'title': 'Heat', 'release_date': date(1995, 12, 15)})
+        other_worker.dispose()
+
+        self.clock.now = 4.9
+        self.assertEqual(self.request().get_json(), [])
+        self.clock.now = 5
+        second = self.request()
+        self.assertEqual(second.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.get_json(), ['Heat'])
+        self.assertNotEqual(second.get_etag(), first.get_etag())
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
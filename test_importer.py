@@ -0,0 +1,122 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import models
+import importer
+from models import Movie, Actor, create_schema
+from importer import csv_integers, detect_format, import_file, read_checkpoint
+from testing import create_test_app
+
+
+class ImporterTestCase(unittest.TestCase):
+    """
+    This class represents the CSV/NDJSON import test case
+    It runs offline against a throwaway SQLite file, which the rows are
+    inserted into instead of being copied.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.app = create_test_app(self.directory)
+        self.context = self.app.app_context()
+        self.context.push()
+        create_schema()
+        self.out = io.StringIO()
+
+    def tearDown(self):
+        models.db.session.remove()
+        self.context.pop()
+        models.db.get_engine(self.app).dispose()
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def titles(self):
+        return [title for title, in models.db.session.query(Movie.title).order_by(Movie.id)]
+
+    def test_csv_integers(self):
+        """Only the integer strings of the given columns should be converted"""
+        record = {'name': '42', 'age': ' 42 ', 'gender': 'male'}
+        self.assertEqual(csv_integers(record, ('age',)), {'name': '42', 'age': 42, 'gender': 'male'})
+        self.assertEqual(csv_integers({'age': '-3'}, ('age',)), {'age': -3})
+        self.assertEqual(csv_integers({'age': 'forty'}, ('age',)), {'age': 'forty'})
+        self.assertEqual(csv_integers({}, ('age',)), {})
+
+    def test_detect_format(self):
+        """The format should follow the extension, an unknown one is an error"""
+        self.assertEqual(detect_format('movies.CSV'), 'csv')
+        self.assertEqual(detect_format('movies.jsonl'), 'ndjson')
+        with self.assertRaises(ValueError):
+            detect_format('movies.txt')
+
+    def test_import_csv_actors(self):
+        """Valid CSV records should be loaded and invalid ones reported and skipped"""
+        path = self.write('actors.csv', [
+            'name,age,gender',
+            'Ana,30,female',
+            'Bob,forty,male',
+            'Cid,25,other',
+            'Dee,41,male'
+        ])
+        loaded, invalid = import_file('actors', path, out=self.out)
+
+        self.assertEqual((loaded, invalid), (2, 2))
+        self.assertIn('record 2 is invalid: age must be an integer', self.out.getvalue())
+        self.assertIn('record 3 is invalid', self.out.getvalue())
+        actors = models.db.session.query(Actor.name, Actor.age, Actor.gender).order_by(Actor.id).all()
+        self.assertEqual(actors, [('Ana', 30, False), ('Dee', 41, True)])
+        self.assertFalse(os.path.exists(path + '.progress'))
+
+    def test_import_ndjson_movies_in_chunks(self):
+        """NDJSON records should be loaded chunk_size at a time"""
+        path = self.write('movies.ndjson', [
+            json.dumps({'title': 'Movie %d' % i, 'release_date': 'March 04, 2022'})
+            for i in range(5)
+        ] + ['not json', json.dumps({'title': ''})])
+        with mock.patch.object(importer, 'copy_rows', wraps=importer.copy_rows) as copy_rows:
+            loaded, invalid = import_file('movies', path, chunk_size=2, out=self.out)
+
+        self.assertEqual((loaded, invalid), (5, 2))
+        self.assertEqual([len(call.args[2]) for call in copy_rows.call_args_list], [2, 2, 1])
+        self.assertEqual(self.titles(), ['Movie %d' % i for i in range(5)])
+
+    def test_failed_chunk_is_resumed_from_the_checkpoint(self):
+        """A failed chunk should leave a checkpoint that --resume continues after"""
+        path = self.write('movies.ndjson', [
+            json.dumps({'title': 'Movie %d' % i, 'release_date': 'March 04, 2022'})
+            for i in range(5)
+        ])
+        copy_rows = importer.copy_rows
+        calls = []
+
+        def fail_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('connection lost')
+            copy_rows(*args)
+
+        with mock.patch.object(importer, 'copy_rows', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                import_file('movies', path, chunk_size=2, out=self.out)
+        self.assertEqual(read_checkpoint(path + '.progress'), 2)
+        self.assertIn('continue after record 2', self.out.getvalue())
+
+        loaded, invalid = import_file('movies', path, chunk_size=2, resume=True, out=self.out)
+        self.assertEqual((loaded, invalid), (3, 0))
+        self.assertIn('resuming after record 2', self.out.getvalue())
+        self.assertEqual(self.titles(), ['Movie %d' % i for i in range(5)])
+        self.assertFalse(os.path.exists(path + '.progress'))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
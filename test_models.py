@@ -0,0 +1,220 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, exc
+
+import models
+from models import (InstrumentedQueuePool, ReplicaSet, Movie, Actor, assign_actor, create_schema,
+                    engine_pool_stats, pool_ready, pool_stats, warm_pool)
+from testing import create_test_app
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    """
+    This class represents the connection pool instrumentation test case
+    It runs offline against throwaway SQLite files.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.apps = []
+
+    def tearDown(self):
+        for app in self.apps:
+            replica_set = models.get_replica_set(app)
+            if replica_set is not None:
+                replica_set.dispose()
+
+    def create_app(self, **engine_options):
+        app = create_test_app(self.directory, **engine_options)
+        self.apps.append(app)
+        return app
+
+    def test_checkout_waits_and_timeouts_are_recorded(self):
+        """Every checkout and every timeout should be counted"""
+        engine = create_engine(
+            'sqlite:///' + os.path.join(self.directory, 'pool.db'),
+            poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05)
+        connection = engine.connect()
+        try:
+            with self.assertRaises(exc.TimeoutError):
+                engine.connect()
+            stats = engine_pool_stats(engine)
+        finally:
+            connection.close()
+            engine.dispose()
+
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['saturation'], 1)
+        self.assertGreaterEqual(stats['wait_max_ms'], 50)
+
+    def test_warm_pool_and_pool_ready(self):
+        """warm_pool should fill the pool, which isn't ready once every connection is out"""
+        app = self.create_app(
+            poolclass=InstrumentedQueuePool, pool_size=2, max_overflow=0)
+        with app.app_context():
+            self.assertEqual(warm_pool(), 2)
+            pool = models.db.engine.pool
+            self.assertEqual(pool.checkedin(), 2)
+            self.assertTrue(pool_ready())
+
+            connections = [models.db.engine.connect() for _ in range(2)]
+            self.assertFalse(pool_ready())
+            for connection in connections:
+                connection.close()
+            self.assertTrue(pool_ready())
+
+    def test_pool_stats_include_the_replicas(self):
+        """pool_stats should report the primary and every replica"""
+        app = self.create_app(
+            replicas=('replica-1.db', 'replica-2.db'),
+            poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0)
+        with app.app_context():
+            stats = pool_stats()
+
+        self.assertEqual(stats['primary']['pool'], 'InstrumentedQueuePool')
+        self.assertEqual(stats['primary']['size'], 1)
+        self.assertEqual(len(stats['replicas']), 2)
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    """
+    This class represents the read replica routing test case
+    The primary and the replica are separate SQLite files holding different
+    movies, so every read tells which database served it.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.app = create_test_app(self.directory, replicas=('replica.db',))
+        with self.app.app_context():
+            create_schema()
+            models.db.session.add(Movie('On the primary', date(2000, 1, 1)))
+            models.db.session.commit()
+        replica = models.get_replica_set(self.app).engines[0]
+        models.db.metadata.create_all(bind=replica)
+        with replica.begin() as connection:
+            connection.execute(Movie.__table__.insert(),
+                               {'title': 'On the replica', 'release_date': date(2000, 1, 1)})
+
+    def tearDown(self):
+        replica_set = models.get_replica_set(self.app)
+        if replica_set is not None:
+            replica_set.dispose()
+
+    def titles(self):
+        return [title for title, in models.db.session.query(Movie.title).all()]
+
+    def test_get_reads_go_to_the_replica(self):
+        """The reads of GET requests should be served by the replica"""
+        with self.app.test_request_context('/movies', method='GET'):
+            self.assertEqual(self.titles(), ['On the replica'])
+            models.db.session.remove()
+
+    def test_other_methods_read_the_primary(self):
+        """The reads of requests that may write should be served by the primary"""
+        with self.app.test_request_context('/movies', method='POST'):
+            self.assertEqual(self.titles(), ['On the primary'])
+            models.db.session.remove()
+
+    def test_reads_after_a_flush_go_to_the_primary(self):
+        """A request should read its own writes once it flushed"""
+        with self.app.test_request_context('/movies', method='GET'):
+            self.assertEqual(self.titles(), ['On the replica'])
+            models.db.session.add(Movie('Written', date(2001, 1, 1)))
+            models.db.session.flush()
+            self.assertEqual(self.titles(), ['On the primary', 'Written'])
+            models.db.session.rollback()
+            models.db.session.remove()
+
+    def test_every_app_keeps_its_replicas(self):
+        """Creating another app should neither replace nor dispose the replicas of this one"""
+        replica_set = models.get_replica_set(self.app)
+        other = create_test_app(self.directory, replicas=('other.db',))
+        self.addCleanup(models.get_replica_set(other).dispose)
+        self.assertIs(models.get_replica_set(self.app), replica_set)
+        self.assertIsNot(models.get_replica_set(other), replica_set)
+        with self.app.test_request_context('/movies', method='GET'):
+            self.assertEqual(self.titles(), ['On the replica'])
+            models.db.session.remove()
+
+    def test_replica_urls_are_normalized(self):
+        """Replica urls should be parsed the same from a string or a list"""
+        urls = ['postgres://replica-1/db', ' postgresql://replica-2/db ']
+        expected = ['postgresql://replica-1/db', 'postgresql://replica-2/db']
+        self.assertEqual(models.replica_urls(','.join(urls) + ','), expected)
+        self.assertEqual(models.replica_urls(urls + ['']), expected)
+
+    def test_dead_replica_fails_over_to_the_primary(self):
+        """A replica that can't connect should be skipped until it is healthy"""
+        models.get_replica_set(self.app).dispose()
+        self.app.extensions['replica_set'] = ReplicaSet(
+            ['sqlite:///' + os.path.join(self.directory, 'missing', 'replica.db')])
+        with self.app.test_request_context('/movies', method='GET'):
+            self.assertEqual(self.titles(), ['On the primary'])
+            models.db.session.remove()
+        self.assertIsNone(models.get_replica_set(self.app).choose())
+
+    def test_replica_is_checked_before_getting_traffic_again(self):
+        """A replica marked down should be back once a background check passes"""
+        replicas = ReplicaSet(
+            ['sqlite:///' + os.path.join(self.directory, 'replica.db')], retry_interval=0)
+        self.addCleanup(replicas.dispose)
+        replicas.mark_down(replicas.engines[0])
+        # The retry interval is over, the check starts and the primary serves meanwhile
+        self.assertIsNone(replicas.choose())
+        for _ in range(100):
+            if replicas.choose() is not None:
+                break
+            time.sleep(0.01)
+        self.assertIs(replicas.choose(), replicas.engines[0])
+
+
+class CastingTestCase(unittest.TestCase):
+    """
+    This class represents the movie-actor casting test case
+    It runs offline against a throwaway SQLite file.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.app = create_test_app(self.directory)
+        self.context = self.app.app_context()
+        self.context.push()
+        create_schema()
+        movie = Movie('Heat', date(1995, 12, 15))
+        actor = Actor('Al Pacino', 55, True)
+        models.db.session.add_all([movie, actor])
+        models.db.session.commit()
+        self.movie_id, self.actor_id = movie.id, actor.id
+
+    def tearDown(self):
+        models.db.session.remove()
+        self.context.pop()
+
+    def test_assigning_twice_is_idempotent(self):
+        """An actor assigned meanwhile by another request should count as assigned"""
+        # Cast by a concurrent request, after the existence checks would run
+        models.db.session.execute(models.castings.insert().values(
+            movie_id=self.movie_id, actor_id=self.actor_id))
+        models.db.session.commit()
+
+        self.assertTrue(assign_actor(self.movie_id, self.actor_id))
+        self.assertTrue(assign_actor(self.movie_id, self.actor_id))
+        self.assertEqual(models.db.session.query(models.castings).count(), 1)
+
+    def test_missing_actor_is_not_assigned(self):
+        """Assigning an actor that doesn't exist should report it"""
+        self.assertFalse(assign_actor(self.movie_id, self.actor_id + 1))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
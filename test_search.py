@@ -0,0 +1,53 @@
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from sqlalchemy import create_engine
+
+import search
+from models import Movie, create_schema
+from testing import create_test_app
+
+
+class FallbackSearchTestCase(unittest.TestCase):
+    """
+    This class represents the in-process trigram search test case
+    It runs offline against a throwaway SQLite file, written to by the app
+    and by a separate engine like another worker would.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.app = create_test_app(self.directory)
+        with self.app.app_context():
+            create_schema()
+            Movie(title='Heat', release_date=date(1995, 12, 15)).insert()
+        search._indexes.clear()
+        self.addCleanup(search._indexes.clear)
+
+    def titles(self, q):
+        with self.app.app_context():
+            return [row[1] for row in search.search(Movie, Movie.title, q, 10)]
+
+    def test_partial_titles_match(self):
+        """The start of a title should find it, and unrelated terms nothing"""
+        self.assertEqual(self.titles('hea'), ['Heat'])
+        self.assertEqual(self.titles('Casablanca'), [])
+
+    def test_writes_of_other_workers_rebuild_the_index(self):
+        """A title committed outside this process should be found by the next search"""
+        self.assertEqual(self.titles('Casablanca'), [])
+
+        other_worker = create_engine(self.app.config['SQLALCHEMY_DATABASE_URI'])
+        with other_worker.begin() as connection:
+            connection.execute(Movie.__table__.insert(),
+                               {'title': 'Casablanca', 'release_date': date(1942, 11, 26)})
+        other_worker.dispose()
+
+        self.assertEqual(self.titles('Casablanca'), ['Casablanca'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
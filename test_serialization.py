@@ -0,0 +1,40 @@
+import json
+import unittest
+from datetime import date
+
+from models import Movie, format_date
+from serialization import StdlibJSONProvider, OrjsonJSONProvider, orjson
+
+
+class SerializationTestCase(unittest.TestCase):
+    """
+    This class represents the serialization test case
+    It runs offline, without a database.
+    """
+
+    def test_format_date_matches_strftime(self):
+        """Release dates should be formatted the way strftime('%B %d, %Y') did"""
+        for value in (date(1999, 1, 1), date(2020, 2, 29), date(2022, 12, 31)):
+            self.assertEqual(format_date(value), value.strftime('%B %d, %Y'))
+
+    def test_format_date_does_not_pad_the_year(self):
+        """Years below 1000 should be formatted without leading zeros"""
+        self.assertEqual(format_date(date(999, 3, 4)), 'March 04, 999')
+        self.assertEqual(format_date(date(5, 12, 31)), 'December 31, 5')
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_providers_encode_the_same_documents(self):
+        """Both json providers should encode documents that decode identically"""
+        document = {'success': True, 'movies': [
+            Movie.format_row((1, 'Amélie', date(2001, 4, 25))),
+            Movie.format_row((2, 'Heat', date(1995, 12, 15)))
+        ]}
+        stdlib = StdlibJSONProvider().dumps(document)
+        fast = OrjsonJSONProvider().dumps(document)
+        self.assertEqual(json.loads(stdlib), document)
+        self.assertEqual(json.loads(fast), json.loads(stdlib))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import time
+import unittest
+from flask import Flask
+
+from warmup import WarmUp
+
+
+class WarmUpTestCase(unittest.TestCase):
+    """
+    This class represents the worker warm-up test case
+    It runs offline, the steps are plain functions.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.calls = []
+
+    def step(self, name, failures=0):
+        def run():
+            self.calls.append(name)
+            if self.calls.count(name) <= failures:
+                raise OSError('%s is unreachable' % name)
+        return (name, run)
+
+    def wait(self, warm_up, state):
+        for _ in range(200):
+            if warm_up.state == state:
+                return
+            time.sleep(0.01)
+        self.fail('warm-up is %s, not %s' % (warm_up.state, state))
+
+    def test_steps_run_once(self):
+        """A warm-up whose steps succeed should run them once and be done"""
+        warm_up = WarmUp(self.app, [self.step('jwks'), self.step('pool')])
+        warm_up.start().join()
+        self.assertTrue(warm_up.done())
+        self.assertEqual(self.calls, ['jwks', 'pool'])
+        self.assertEqual(set(warm_up.timings), {'jwks', 'pool'})
+
+    def test_failed_steps_are_retried_with_backoff(self):
+        """Only the failed steps should be retried, at growing intervals"""
+        warm_up = WarmUp(self.app, [self.step('jwks', failures=2), self.step('pool')],
+                         retry_interval=0.05, max_retry_interval=0.08)
+        start = time.perf_counter()
+        warm_up.start().join(5)
+
+        self.assertTrue(warm_up.done())
+        self.assertEqual(self.calls, ['jwks', 'pool', 'jwks', 'jwks'])
+        self.assertEqual(warm_up.attempts, 3)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05 + 0.08)
+
+    def test_stop_ends_the_retries(self):
+        """A stopped warm-up should stay failed and stop retrying"""
+        warm_up = WarmUp(self.app, [self.step('jwks', failures=100)], retry_interval=60)
+        thread = warm_up.start()
+        self.wait(warm_up, 'failed')
+        warm_up.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.calls, ['jwks'])
+        self.assertFalse(warm_up.done())
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+
+import auth
+from app import create_app
+from benchmarks.common import generate_signing_key, sign_token
+
+
+'''
+Helpers shared by the offline tests
+Tokens are signed for a fixed test tenant with keys generated locally (see
+benchmarks.common), and apps are bound to throwaway SQLite files.
+'''
+TEST_DOMAIN = 'test.auth0.local'
+TEST_AUDIENCE = 'castingagency'
+
+
+def setup_test_auth(test):
+    """Verifies tokens against the test tenant until the test ends"""
+    test.addCleanup(setattr, auth, 'AUTH0_DOMAIN', auth.AUTH0_DOMAIN)
+    test.addCleanup(setattr, auth, 'API_AUDIENCE', auth.API_AUDIENCE)
+    auth.setup_auth(TEST_DOMAIN, TEST_AUDIENCE)
+
+
+def sign_test_token(pem, kid, permissions, expires_in=3600):
+    """Signs a token of the test tenant with the local key pem"""
+    return sign_token(pem, kid, TEST_DOMAIN, TEST_AUDIENCE, permissions,
+                      expires_in=expires_in, subject='auth0|test')
+
+
+def create_test_app(directory, replicas=(), **engine_options):
+    """Creates an app of the test tenant bound to SQLite files of directory"""
+    app = create_app({
+        'AUTH0_DOMAIN': TEST_DOMAIN,
+        'API_AUDIENCE': TEST_AUDIENCE,
+        'DATABASE_URL': 'sqlite:///' + os.path.join(directory, 'primary.db'),
+        'DATABASE_REPLICA_URLS': ['sqlite:///' + os.path.join(directory, name) for name in replicas]
+    })
+    if engine_options:
+        # SQLite gets no pool options from the environment
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    return app
+
+
+class FakeClock:
+    """Stands in for time.monotonic, moved forward by setting now"""
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import threading
+
+
+# Warm the JWKS, the connection pool and the hot queries up in the background
+# when a worker creates its app
+WARM_UP = os.environ.get('WARM_UP', '').lower() in ('1', 'true', 'yes')
+# Seconds before a failed warm-up step is first retried, doubled on every
+# failure up to WARM_UP_MAX_RETRY_INTERVAL
+WARM_UP_RETRY_INTERVAL = float(os.environ.get('WARM_UP_RETRY_INTERVAL', 1))
+WARM_UP_MAX_RETRY_INTERVAL = float(os.environ.get('WARM_UP_MAX_RETRY_INTERVAL', 60))
+
+logger = logging.getLogger(__name__)
+
+'''
+WarmUp
+Runs the steps that make the first requests of a worker as fast as the
+next ones in a background thread, so the worker serves /healthz right away
+    steps is a list of (name, function) run in order within an app
+        context, a failing step is logged and the next ones still run
+    state is 'pending', 'running', 'done' or 'failed' while a step failed,
+        and timings the milliseconds every step took
+    the failed steps are retried by the same thread, after retry_interval
+        seconds doubled on every failure up to max_retry_interval, until
+        they all succeeded or stop() is called, so an outage of the
+        database or Auth0 is probed at a bounded rate whatever reads the
+        state
+'''
+class WarmUp:
+    def __init__(self, app, steps, retry_interval=WARM_UP_RETRY_INTERVAL,
+                 max_retry_interval=WARM_UP_MAX_RETRY_INTERVAL):
+        self.app = app
+        self.steps = steps
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.state = 'pending'
+        self.timings = {}
+        self.errors = {}
+        self.attempts = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _run_steps(self, steps):
+        errors = {}
+        for name, step in steps:
+            start = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    step()
+            except Exception as e:
+                logger.exception('warm-up step %s failed', name)
+                errors[name] = str(e)
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        self.errors = errors
+        self.attempts += 1
+
+    def run(self):
+        with self._lock:
+            if self.state != 'pending':
+                return
+            self.state = 'running'
+        steps = self.steps
+        interval = self.retry_interval
+        while True:
+            self._run_steps(steps)
+            if not self.errors:
+                self.state = 'done'
+                logger.info('warm-up done in %.1fms', sum(self.timings.values()))
+                return
+            self.state = 'failed'
+            logger.warning('warm-up failed, retrying %s in %.1fs',
+                           ', '.join(self.errors), interval)
+            if self._stopped.wait(interval):
+                return
+            steps = [(name, step) for name, step in self.steps if name in self.errors]
+            interval = min(interval * 2, self.max_retry_interval)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stopped.set()
+
+    def done(self):
+        return self.state == 'done'